@@ -1,18 +1,29 @@
 import asyncio
 import contextlib
 import logging
+import time
 
-import aiohttp
 import uvicorn
 from slack_bolt.async_app import AsyncAck
 from slack_sdk.web.async_client import AsyncWebClient
 from starlette.applications import Starlette
 
+from utils.activity import activity_log
+from utils.db import ensure_indexes
 from utils.db import get_user_settings
+from utils.db import save_user_settings
 from utils.db import update_user_settings
+from utils.dedup import EventDeduplicator
+from utils.emoji import emoji_catalogue
 from utils.env import env
+from utils.http import create_http_session
+from utils.leases import partition_leases
+from utils.polling import polling_policy
 from utils.slack import app
+from utils.slack import cache_slack_user
 from utils.slack import check_token
+from utils.slack import seed_user_directory
+from utils.slack import status_cache
 from utils.slack import update_slack_pfp
 from utils.slack import update_slack_status
 from utils.update import run_updater
@@ -22,7 +33,11 @@ logging.basicConfig(
     level=logging.INFO,
 )
 
-huddles_acknowledged = []
+event_deduplicator = EventDeduplicator(
+    ttl=env.event_dedup_ttl,
+    max_size=env.event_dedup_max_size,
+    collection=env.motor_client["slickstats"].events if env.event_dedup_mongo else None,
+)
 
 
 def get_home(user_data: dict) -> dict:
@@ -102,11 +117,11 @@ async def submit_settings(ack: AsyncAck, body):
                 elif "selected_option" in action:
                     data[block_id] = action["selected_option"]["value"]
 
-    await update_user_settings(body["user"]["id"], data)
-    user = await get_user_settings(user_id=body["user"]["id"])
-    installation = await env.installation_store.async_find_installation(
-        user_id=body["user"]["id"]
+    user, installation = await asyncio.gather(
+        save_user_settings(body["user"]["id"], data),
+        env.installation_store.async_find_installation(user_id=body["user"]["id"]),
     )
+    polling_policy.reset(body["user"]["id"])
     if not installation:
         return
     await app.client.views_publish(
@@ -124,6 +139,7 @@ async def toggle_enabled(ack: AsyncAck, body):
     await update_user_settings(
         body["user"]["id"], {"enabled": not user.get("enabled", True)}
     )
+    polling_policy.reset(body["user"]["id"])
     installation = await env.installation_store.async_find_installation(
         user_id=body["user"]["id"]
     )
@@ -141,56 +157,40 @@ async def toggle_enabled(ack: AsyncAck, body):
 async def emojis_data_source_handler(ack: AsyncAck, body):
     """Returns a list of emojis for the user to choose from"""
     keyword = body.get("value")
+    await ack(options=await emoji_catalogue.search(keyword, limit=100))
 
-    emojis_info = await env.slack_client.emoji_list()
-    emojis = emojis_info.get("emoji", [])
 
-    options = [
-        {
-            "text": {"type": "plain_text", "text": f":{emoji}: {emoji}"},
-            "value": f":{emoji}:",
-        }
-        for emoji in emojis
-    ]
-
-    if keyword and len(keyword) > 0:
-        options = [option for option in options if keyword in option["text"]["text"]]
-        await ack(options=options[:100])
-    else:
-        await ack(options=options[:100])
+@app.event("emoji_changed")
+async def emoji_changed(event, ack: AsyncAck):
+    """Keeps the emoji catalogue in sync when custom emojis are added, removed or renamed"""
+    await ack()
+    match event.get("subtype"):
+        case "add":
+            emoji_catalogue.add([event.get("name")])
+        case "remove":
+            emoji_catalogue.remove(event.get("names", []))
+        case "rename":
+            emoji_catalogue.remove([event.get("old_name")])
+            emoji_catalogue.add([event.get("new_name")])
 
 
 @app.event("user_huddle_changed")
 async def huddle_changed(event, ack: AsyncAck):
     """Updates the user's Slack status and profile picture when they enter or leave a huddle"""
     await ack()
-    if event.get("event_ts") in huddles_acknowledged:
+    if await event_deduplicator.seen(f"user_huddle_changed:{event.get('event_ts')}"):
         return
 
-    huddles_acknowledged.append(event.get("event_ts"))
     in_huddle = event.get("user", {}).get("profile", {}).get("huddle_state", None)
 
-    user_info = await env.slack_client.users_info(user=event["user"]["id"])
-    display = (
-        user_info["user"]["profile"]["display_name"]
-        or user_info["user"]["profile"]["real_name"]
-        or user_info["user"]["name"]
-    )
-
     match in_huddle:
         case "in_a_huddle":
-            await env.slack_client.chat_postMessage(
-                channel=env.slack_log_channel,
-                text=f"{display} joined a huddle",
-                icon_url=user_info["user"]["profile"]["image_512"],
-                username=display,
+            activity_log.log(
+                event["user"]["id"], "joined a huddle", env.slack_token, with_name=True
             )
         case "default_unset" | None:
-            await env.slack_client.chat_postMessage(
-                channel=env.slack_log_channel,
-                text=f"{display} left a huddle",
-                icon_url=user_info["user"]["profile"]["image_512"],
-                username=display,
+            activity_log.log(
+                event["user"]["id"], "left a huddle", env.slack_token, with_name=True
             )
 
     user = await get_user_settings(user_id=event["user"]["id"])
@@ -234,6 +234,7 @@ async def huddle_changed(event, ack: AsyncAck):
                     )
         case "default_unset" | None:
             await update_user_settings(event["user"]["id"], {"in_huddle": False})
+            polling_policy.reset(event["user"]["id"])
             if user.get("pfp") == "huddle_pfp":
                 await update_slack_pfp(
                     new_pfp_type="default_pfp",
@@ -252,41 +253,118 @@ async def huddle_changed(event, ack: AsyncAck):
                 )
 
 
+@app.event("user_change")
+@app.event("user_status_changed")
+async def user_changed(event, ack: AsyncAck):
+    """Forgets the cached Slack status of a user whose profile has changed and refreshes their user directory entry"""
+    await ack()
+    user = event.get("user", {})
+    status_cache.pop(user.get("id"))
+    if user.get("id") and user.get("profile"):
+        cache_slack_user(user)
+
+
 @app.event("app_uninstalled")
 async def app_uninstalled(event, ack: AsyncAck):
     """The app has been uninstalled from the workspace, send a status update"""
     await ack()
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            env.slack_webhook_url,
-            json={"status": "down", "reason": "App uninstalled", "hash": env.git_hash},
-        ):
-            logging.error(f"User {event['user']['id']} uninstalled the app")
-            exit()
+    async with env.http_session.post(
+        env.slack_webhook_url,
+        json={"status": "down", "reason": "App uninstalled", "hash": env.git_hash},
+    ):
+        logging.error(f"User {event['user']['id']} uninstalled the app")
+        exit()
 
 
 @contextlib.asynccontextmanager
 async def main(_app: Starlette):
-    """Runs the app and connects to the Slack API and MongoDB"""
-    await env.motor_client.admin.command("ping")
-    logging.info("Connected to MongoDB")
-
-    asyncio.create_task(run_updater())
+    """Runs the app and connects to the Slack API and MongoDB. Everything that talks to MongoDB or Slack runs in the background so the server starts accepting events straight away"""
+    env.http_session = create_http_session()
+
+    # Every background task, so they can be cancelled on shutdown
+    tasks: list[asyncio.Task] = []
+    for coroutine in [
+        connect_mongo(tasks),
+        seed_user_directory(),
+        send_up_status(),
+        activity_log.run(),
+    ]:
+        tasks.append(asyncio.create_task(coroutine))
+    # Started through the catalogue so searches made before it finishes don't fetch the list again
+    tasks.append(emoji_catalogue.start_refresh())
 
     logging.info(f"Starting Uvicorn app on port {env.port}")
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
+    yield
+    logging.info("Shutting down")
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await activity_log.flush()
+    await env.http_session.close()
+
+
+async def connect_mongo(tasks: list[asyncio.Task]):
+    """Checks the MongoDB connection, prepares its indexes, the user settings cache and the updater's partition leases and then starts the updater. The updater is started even if MongoDB can't be reached yet
+
+    Keyword arguments:
+
+    tasks -- The list the started background tasks are added to
+    """
+    try:
+        await env.motor_client.admin.command("ping")
+        logging.info("Connected to MongoDB")
+        await ensure_indexes()
+        await event_deduplicator.ensure_indexes()
+        await env.user_settings.load()
+        if env.updater_sharding:
+            await partition_leases.ensure_indexes()
+            await partition_leases.heartbeat()
+    except Exception as e:
+        logging.error(f"Failed to prepare MongoDB: {e}")
+    tasks.append(asyncio.create_task(env.user_settings.run()))
+
+    # Until a heartbeat succeeds the replica owns no partitions, so the updater skips every user
+    if env.updater_sharding:
+        tasks.append(asyncio.create_task(partition_leases.run()))
+    tasks.append(asyncio.create_task(run_updater()))
+
+
+async def wait_until_listening(timeout: float = 10) -> bool:
+    """Waits until the server accepts connections on `env.port`. Returns False if it still doesn't after `timeout` seconds
+
+    Keyword arguments:
+
+    timeout -- The longest time in seconds to wait (default 10)
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", env.port)
+        except OSError:
+            await asyncio.sleep(0.05)
+            continue
+        writer.close()
+        await writer.wait_closed()
+        return True
+    return False
+
+
+async def send_up_status():
+    """Tells the status webhook that the app has started once the server is listening"""
+    if not await wait_until_listening():
+        logging.warning(f"Server isn't listening on port {env.port} yet")
+    try:
+        async with env.http_session.post(
             env.slack_webhook_url,
             json={"status": "up", "reason": "App started", "hash": env.git_hash},
         ) as resp:
             if resp.status != 200:
                 logging.error(f"Failed to send status update: {resp.status}")
             logging.info("Connected to Slack API")
-
-    yield
-    logging.info("Closing Socket Mode handler")
+    except Exception as e:
+        logging.error(f"Failed to send status update: {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,356 @@
+"""Offline benchmark for the status updater
+
+Starts local stand-ins for Last.fm, Steam, Jellyfin, the Slack Web API and profile picture hosting, seeds an in-memory MongoDB (mongomock-motor) with synthetic users and installations, then runs `update_status` ticks against them and reports throughput, per-user latency and API calls per user. Nothing leaves the machine.
+
+Run it from the repository root:
+
+    python -m pip install -r benchmarks/requirements.txt
+    python -m benchmarks.updater --users 500 --ticks 5 --provider-latency 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# The app refuses to start without these, but none of them are used against real services here
+for key in [
+    "SLACK_CLIENT_ID",
+    "SLACK_CLIENT_SECRET",
+    "SLACK_SIGNING_SECRET",
+    "SLACK_TEAM_ID",
+    "SLACK_HEARTBEAT_CHANNEL",
+    "SLACK_LOG_CHANNEL",
+    "SLACK_WEBHOOK_URL",
+    "DOMAIN",
+]:
+    os.environ.setdefault(key, "benchmark")
+os.environ.setdefault("SLACK_TOKEN", "xoxb-benchmark")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import mongomock.collection  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+from slack_sdk.oauth.installation_store.models.installation import (  # noqa: E402
+    Installation,
+)
+
+import status.lastfm  # noqa: E402
+import status.steam  # noqa: E402
+import utils.ratelimit  # noqa: E402
+import utils.update  # noqa: E402
+from utils.activity import activity_log  # noqa: E402
+from utils.env import env  # noqa: E402
+from utils.http import create_http_session  # noqa: E402
+from utils.MongoDBInstallatonStore import MongoDBInstallationStore  # noqa: E402
+from utils.polling import polling_policy  # noqa: E402
+from utils.settings import UserSettingsCache  # noqa: E402
+from utils.slack import app  # noqa: E402
+
+JELLYFIN_SERVERS = 5
+
+# pymongo 4.9+ passes `sort` to bulk updates, which mongomock doesn't accept yet
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+mongomock.collection.BulkOperationBuilder.add_update = (
+    lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+)
+
+
+class StandIns:
+    """Local HTTP servers standing in for every external service the updater talks to"""
+
+    def __init__(self, latency: float, error_rate: float, slack_latency: float):
+        """Initialises the StandIns
+
+        Keyword arguments:
+
+        latency -- The time in seconds each provider and image request takes
+
+        error_rate -- The chance of a provider request failing with a 500
+
+        slack_latency -- The time in seconds each Slack API call takes
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slack_latency = slack_latency
+        self.calls: Counter[str] = Counter()
+        self.runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def start(self):
+        """Starts the servers on a free local port"""
+        server = web.Application(middlewares=[self.middleware])
+        server.router.add_get("/lastfm/2.0/", self.lastfm)
+        server.router.add_get("/steam/ISteamUser/GetPlayerSummaries/v2/", self.steam)
+        server.router.add_get("/jellyfin/{server}/Sessions", self.jellyfin)
+        server.router.add_get("/images/{name}", self.image)
+        server.router.add_route("*", "/slack/api/{method}", self.slack)
+        self.runner = web.AppRunner(server, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        """Stops the servers"""
+        await self.runner.cleanup()
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        service = request.path.split("/")[1]
+        if service == "slack":
+            self.calls[f"slack:{request.match_info.get('method')}"] += 1
+            await asyncio.sleep(self.slack_latency)
+        else:
+            self.calls[service] += 1
+            await asyncio.sleep(self.latency)
+            if random.random() < self.error_rate:
+                return web.Response(status=500)
+        return await handler(request)
+
+    async def lastfm(self, request: web.Request) -> web.Response:
+        # Each user switches tracks now and then and is idle some of the time
+        user = request.query["user"]
+        track = int(time.time() / 180) + hash(user) % 7
+        nowplaying = hash((user, track)) % 3 != 0
+        return web.json_response(
+            {
+                "recenttracks": {
+                    "track": [
+                        {
+                            "name": f"Track {track}",
+                            "artist": {"#text": "Benchmark"},
+                            "url": f"https://last.fm/track/{track}",
+                            "@attr": {"nowplaying": "true"} if nowplaying else {},
+                        }
+                    ]
+                }
+            }
+        )
+
+    async def steam(self, request: web.Request) -> web.Response:
+        steam_ids = request.query["steamids"].split(",")
+        return web.json_response(
+            {
+                "response": {
+                    "players": [
+                        {
+                            "steamid": steam_id,
+                            "personaname": f"player{steam_id}",
+                            "gameextrainfo": "Benchmark Simulator"
+                            if int(steam_id) % 4 == 0
+                            else None,
+                            "gameid": "1",
+                        }
+                        for steam_id in steam_ids
+                    ]
+                }
+            }
+        )
+
+    async def jellyfin(self, request: web.Request) -> web.Response:
+        server = request.match_info["server"]
+        return web.json_response(
+            [
+                {
+                    "UserName": f"{server}-viewer{i}",
+                    "NowPlayingItem": {
+                        "Type": "Movie",
+                        "Name": f"Film {i}",
+                        "PremiereDate": "2024-01-01",
+                        "ExternalUrls": [{"Name": "IMDb", "Url": "https://imdb.com"}],
+                    },
+                }
+                for i in range(20)
+            ]
+        )
+
+    async def image(self, request: web.Request) -> web.Response:
+        etag = f'"{request.match_info["name"]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        return web.Response(
+            body=request.match_info["name"].encode() * 1024,
+            content_type="image/png",
+            headers={"ETag": etag},
+        )
+
+    async def slack(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = {"ok": True}
+        match method:
+            case "users.profile.get":
+                data["profile"] = {"status_text": "", "status_emoji": ""}
+            case "users.info":
+                data["user"] = {
+                    "id": "U",
+                    "name": "benchmark",
+                    "profile": {"display_name": "Benchmark", "image_512": ""},
+                }
+            case "chat.postMessage":
+                data["ts"] = str(time.time())
+        return web.json_response(data)
+
+
+async def seed(users: int, url: str) -> AsyncMongoMockClient:
+    """Fills an in-memory MongoDB with synthetic users and their installations and points the app at it
+
+    Keyword arguments:
+
+    users -- The number of users to create
+
+    url -- The base URL of the stand-in servers
+    """
+    client = AsyncMongoMockClient()
+    documents = []
+    installations = []
+    for i in range(users):
+        user_id = f"U{i:06d}"
+        document = {
+            "user_id": user_id,
+            "enabled": True,
+            "lastfm_username": f"listener{i}",
+            "lastfm_api_key": "benchmark",
+            "default_pfp": f"{url}/images/default",
+            "music_pfp": f"{url}/images/music",
+            "gaming_pfp": f"{url}/images/gaming",
+            "film_pfp": f"{url}/images/film",
+        }
+        if i % 2 == 0:
+            document |= {"steam_id": str(76561198000000000 + i), "steam_api_key": "k"}
+        if i % 3 == 0:
+            server = f"server{i % JELLYFIN_SERVERS}"
+            document |= {
+                "jellyfin_url": f"{url}/jellyfin/{server}",
+                "jellyfin_api_key": server,
+                "jellyfin_username": f"{server}-viewer{i % 40}",
+            }
+        documents.append(document)
+        installations.append(
+            Installation(
+                app_id="A",
+                team_id="T",
+                user_id=user_id,
+                bot_token="xoxb-benchmark",
+                user_token=f"xoxp-{user_id}",
+            ).to_dict()
+        )
+    await client["slickstats"].users.insert_many(documents)
+    await client["slack"].installations.insert_many(installations)
+
+    env.motor_client = client
+    env.user_settings = UserSettingsCache(
+        client["slickstats"].users, env.settings_resync_interval
+    )
+    env.installation_store = MongoDBInstallationStore(
+        lambda: client,
+        token_cache=env.token_cache,
+        get_user_settings=lambda: env.user_settings,
+    )
+    return client
+
+
+async def run(args: argparse.Namespace):
+    stand_ins = StandIns(args.provider_latency, args.error_rate, args.slack_latency)
+    await stand_ins.start()
+    await seed(args.users, stand_ins.url)
+
+    status.lastfm.BASE_URL = f"{stand_ins.url}/lastfm/2.0/"
+    status.steam.BASE_URL = f"{stand_ins.url}/steam"
+    for client in [app.client, env.slack_client]:
+        client.base_url = f"{stand_ins.url}/slack/api/"
+    if not args.slack_rate_limits:
+        for method in utils.ratelimit.SLACK_RATE_LIMITS:
+            utils.ratelimit.SLACK_RATE_LIMITS[method] = (1e9, 1e9)
+    env.updater_concurrency = args.concurrency
+    env.http_session = create_http_session()
+    activity = asyncio.create_task(activity_log.run())
+
+    latencies = []
+    update_user = utils.update.update_user
+
+    async def timed_update_user(*update_args, **update_kwargs):
+        start = time.perf_counter()
+        try:
+            return await update_user(*update_args, **update_kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    utils.update.update_user = timed_update_user
+
+    tick_durations = []
+    for _ in range(args.ticks):
+        if not args.adaptive:
+            polling_policy.states.clear()
+        start = time.perf_counter()
+        await utils.update.update_status()
+        tick_durations.append(time.perf_counter() - start)
+
+    # Post the lines still waiting for their digest so their Slack calls are counted
+    activity.cancel()
+    await asyncio.gather(activity, return_exceptions=True)
+    await activity_log.flush()
+    await env.http_session.close()
+    await stand_ins.stop()
+
+    evaluations = max(1, len(latencies))
+    print(f"users: {args.users}, ticks: {args.ticks}, concurrency: {args.concurrency}")
+    print(f"ticks/sec: {args.ticks / sum(tick_durations):.3f}")
+    print(
+        f"tick duration: mean {statistics.mean(tick_durations):.3f}s, max {max(tick_durations):.3f}s"
+    )
+    if latencies:
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"per-user latency: p50 {quantiles[49] * 1000:.1f}ms, p99 {quantiles[98] * 1000:.1f}ms"
+        )
+    print(f"user evaluations: {len(latencies)}")
+    print("API calls per user evaluation:")
+    for name, calls in sorted(stand_ins.calls.items()):
+        print(f"  {name}: {calls / evaluations:.3f}")
+    print(f"  total: {sum(stand_ins.calls.values()) / evaluations:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=env.updater_concurrency)
+    parser.add_argument(
+        "--provider-latency",
+        type=float,
+        default=0.05,
+        help="Seconds each provider and image request takes",
+    )
+    parser.add_argument(
+        "--slack-latency",
+        type=float,
+        default=0.02,
+        help="Seconds each Slack API call takes",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Chance of a provider request failing with a 500",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Keep the adaptive polling policy instead of evaluating every user each tick",
+    )
+    parser.add_argument(
+        "--slack-rate-limits",
+        action="store_true",
+        help="Keep the Slack write queue's real rate limits",
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
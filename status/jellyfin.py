@@ -1,15 +1,22 @@
+import asyncio
 import logging
 
 import aiohttp
 
 from utils.db import update_user_settings
+from utils.env import env
+from utils.http import fetch_json
 
 
-async def get_playing(base_url: str, api_key: str) -> dict:
+async def get_playing(
+    session: aiohttp.ClientSession, base_url: str, api_key: str
+) -> dict:
     """Returns a JSON response with the currently playing media from Jellyfin
 
     Keyword arguments:
 
+    session -- The shared HTTP session to make the request with
+
     base_url -- URL of the Jellyfin server (e.g. http://localhost:8096)
 
     api_key -- API key for the Jellyfin server (e.g. 1234567890abcdef1234567890abcdef)
@@ -18,20 +25,65 @@ async def get_playing(base_url: str, api_key: str) -> dict:
     """
     url = f"{base_url}/Sessions?active=true"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers={"X-Emby-Token": api_key}) as res:
-                return await res.json()
+        return await fetch_json(
+            session, url, provider="jellyfin", headers={"X-Emby-Token": api_key}
+        )
     except Exception as e:
         logging.error(e)
         return {}
 
 
-async def get_jellyfin_status(user: dict) -> tuple[str | None, str | None]:
+def index_sessions(sessions: list[dict]) -> dict[str, dict]:
+    """Returns the sessions that are currently playing something keyed by their username. If a user has several such sessions, the first one is kept
+
+    Keyword arguments:
+
+    sessions -- The sessions returned by `get_playing`
+    """
+    index = {}
+    if not isinstance(sessions, list):
+        return index
+    for session in sessions:
+        username = session.get("UserName")
+        if username and session.get("NowPlayingItem") and username not in index:
+            index[username] = session
+    return index
+
+
+async def prefetch_jellyfin_sessions(
+    users: list[dict],
+) -> dict[tuple[str, str], dict[str, dict]]:
+    """Fetches the active sessions of every distinct Jellyfin server once and indexes them by username. Returns the indexes keyed by (server URL, API key)
+
+    Keyword arguments:
+
+    users -- A list of dictionaries with the users' settings
+    """
+    servers = {
+        (user.get("jellyfin_url"), user.get("jellyfin_api_key"))
+        for user in users
+        if user.get("jellyfin_url")
+        and user.get("jellyfin_api_key")
+        and user.get("jellyfin_username")
+    }
+    results = await asyncio.gather(
+        *(get_playing(env.http_session, url, api_key) for url, api_key in servers)
+    )
+    return {
+        server: index_sessions(sessions) for server, sessions in zip(servers, results)
+    }
+
+
+async def get_jellyfin_status(
+    user: dict, sessions: dict[tuple[str, str], dict[str, dict]] | None = None
+) -> tuple[str | None, str | None]:
     """Returns a tuple with the current Jellyfin media and a log message if the media has changed. If the user has no settings, is not playing anything, the media isn't a Movie or Episode or the request errors, returns None, None
 
     Keyword arguments:
 
     user -- A dictionary with the user's settings
+
+    sessions -- Session indexes prefetched by `prefetch_jellyfin_sessions`. If None, the user's server is fetched on its own (default None)
     """
     if not user:
         return None, None
@@ -42,12 +94,9 @@ async def get_jellyfin_status(user: dict) -> tuple[str | None, str | None]:
         await update_user_settings(user.get("user_id"), {"current_jellyfin": None})
         return None, None
 
-    sessions = await get_playing(base_url, api_key) or []
-    res = None
-    for session in sessions:
-        if session.get("UserName") == username and session.get("NowPlayingItem"):
-            res = session
-            break
+    if sessions is None:
+        sessions = await prefetch_jellyfin_sessions([user])
+    res = sessions.get((base_url, api_key), {}).get(username)
 
     if not res:
         await update_user_settings(user.get("user_id"), {"current_jellyfin": None})
@@ -3,15 +3,21 @@ import logging
 import aiohttp
 
 from utils.db import update_user_settings
+from utils.env import env
+from utils.http import fetch_json
 
 BASE_URL = "http://ws.audioscrobbler.com/2.0/"
 
 
-async def get_playing(api_key: str, username: str) -> dict | None:
+async def get_playing(
+    session: aiohttp.ClientSession, api_key: str, username: str
+) -> dict | None:
     """Returns a JSON response with the currently playing media from Last.fm
 
     Keyword arguments:
 
+    session -- The shared HTTP session to make the request with
+
     api_key -- API key for the last.fm API (e.g. 1234567890abcdef1234567890abcdef)
 
     username -- Last.fm username (e.g. user123)
@@ -20,9 +26,7 @@ async def get_playing(api_key: str, username: str) -> dict | None:
     """
     url = f"{BASE_URL}?method=user.getrecenttracks&api_key={api_key}&format=json&user={username}"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as res:
-                return await res.json()
+        return await fetch_json(session, url, provider="lastfm")
     except Exception as e:
         logging.error(e)
         return None
@@ -42,7 +46,7 @@ async def get_lastfm_status(user: dict) -> tuple[str | None, str | None]:
     if not api_key or not username:
         return None, None
 
-    playing = await get_playing(api_key, username)
+    playing = await get_playing(env.http_session, api_key, username)
     if not playing:
         await update_user_settings(user.get("user_id"), {"current_song": None})
         return None, None
@@ -1,39 +1,107 @@
+import asyncio
 import logging
 
 import aiohttp
 
 from utils.db import update_user_settings
+from utils.env import env
+from utils.http import fetch_json
 
 BASE_URL = "https://api.steampowered.com"
+MAX_STEAM_IDS = 100
 
 
-async def get_playing(api_key: str, user_id: str) -> dict | None:
+async def get_playing(
+    session: aiohttp.ClientSession, api_key: str, user_id: str
+) -> dict | None:
     """Returns a JSON response with the currently playing game from Steam
 
     Keyword arguments:
 
+    session -- The shared HTTP session to make the request with
+
     api_key -- API key for the Steam API (e.g. 1234567890abcdef1234567890abcdef)
 
-    user_id -- Steam User ID (e.g. 76561198012345678)
+    user_id -- Steam User ID, or a comma separated list of up to `MAX_STEAM_IDS` IDs (e.g. 76561198012345678)
 
     If there's an error executing the request it returns None
     """
     url = f"{BASE_URL}/ISteamUser/GetPlayerSummaries/v2/?key={api_key}&format=json&steamids={user_id}"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as res:
-                return await res.json()
+        return await fetch_json(session, url, provider="steam")
     except Exception as e:
         logging.error(e)
         return None
 
 
-async def get_steam_status(user: dict) -> tuple[None | str, None | str]:
+async def get_players(
+    session: aiohttp.ClientSession, api_key: str, steam_ids: list[str]
+) -> dict[str, dict]:
+    """Returns the player summaries for the given Steam IDs keyed by Steam ID. The IDs are requested in chunks of at most `MAX_STEAM_IDS` per call
+
+    Keyword arguments:
+
+    session -- The shared HTTP session to make the requests with
+
+    api_key -- API key for the Steam API (e.g. 1234567890abcdef1234567890abcdef)
+
+    steam_ids -- Steam User IDs (e.g. ["76561198012345678"])
+
+    Chunks that error are left out of the result
+    """
+    chunks = [
+        steam_ids[i : i + MAX_STEAM_IDS]
+        for i in range(0, len(steam_ids), MAX_STEAM_IDS)
+    ]
+    responses = await asyncio.gather(
+        *(get_playing(session, api_key, ",".join(chunk)) for chunk in chunks)
+    )
+    players = {}
+    for playing in responses:
+        if not playing:
+            continue
+        for player in playing.get("response", {}).get("players", []):
+            players[player.get("steamid")] = player
+    return players
+
+
+async def prefetch_steam_players(users: list[dict]) -> dict[tuple[str, str], dict]:
+    """Fetches the player summaries of every user in as few requests as possible by batching all Steam IDs that share an API key. Returns the summaries keyed by (API key, Steam ID)
+
+    Keyword arguments:
+
+    users -- A list of dictionaries with the users' settings
+    """
+    steam_ids = {}
+    for user in users:
+        api_key = user.get("steam_api_key")
+        user_id = user.get("steam_id")
+        if api_key and user_id:
+            steam_ids.setdefault(api_key, set()).add(user_id)
+
+    results = await asyncio.gather(
+        *(
+            get_players(env.http_session, api_key, sorted(ids))
+            for api_key, ids in steam_ids.items()
+        )
+    )
+    return {
+        (api_key, steam_id): player
+        for api_key, players in zip(steam_ids, results)
+        for steam_id, player in players.items()
+    }
+
+
+async def get_steam_status(
+    user: dict, players: dict[tuple[str, str], dict] | None = None
+) -> tuple[None | str, None | str]:
     """Returns a tuple with the Steam game currently being played and a log message if the media has changed. If the user has no settings, is not playing anything or the request errors, returns None, None
 
     Keyword arguments:
 
     user -- A dictionary with the user's settings
+
+    players -- Player summaries prefetched by `prefetch_steam_players`. If None, the user's summary is fetched on its own (default None)
     """
     if not user:
         return None, None
@@ -42,16 +110,14 @@ async def get_steam_status(user: dict) -> tuple[None | str, None | str]:
     if not api_key or not user_id:
         await update_user_settings(user.get("user_id"), {"current_game": None})
         return None, None
-    playing = await get_playing(api_key, user_id)
-    if not playing:
-        await update_user_settings(user.get("user_id"), {"current_game": None})
-        return None, None
-    players = playing.get("response", {}).get("players", [])
-    if not players:
+    if players is None:
+        players = await prefetch_steam_players([user])
+    player = players.get((api_key, user_id))
+    if not player:
         await update_user_settings(user.get("user_id"), {"current_game": None})
         return None, None
-    current = players[0].get("gameextrainfo")
-    username = players[0].get("personaname")
+    current = player.get("gameextrainfo")
+    username = player.get("personaname")
     current_game = user.get("current_game")
     if current_game == current:
         return current, None
@@ -61,7 +127,7 @@ async def get_steam_status(user: dict) -> tuple[None | str, None | str]:
     else:
         current_game = current
         await update_user_settings(user.get("user_id"), {"current_game": current_game})
-        game_id = players[0].get("gameid")
+        game_id = player.get("gameid")
         url = f"https://store.steampowered.com/app/{game_id}"
         log_message = f"<https://steamcommunity.com/profiles/{user_id}|{username}> is playing <{url}|*{current}*>"
         return current, log_message
@@ -1,12 +1,18 @@
+from functools import cached_property
+from typing import Callable
 from typing import Optional
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
 from slack_sdk.oauth.installation_store.async_installation_store import (
     AsyncInstallationStore,
 )
 from slack_sdk.oauth.installation_store.models.bot import Bot
 from slack_sdk.oauth.installation_store.models.installation import Installation
 
+from utils.cache import TTLCache
+from utils.settings import UserSettingsCache
+
 
 class MongoDBInstallationStore(AsyncInstallationStore):
     """A MongoDB-based InstallationStore implementation
@@ -14,22 +20,49 @@ class MongoDBInstallationStore(AsyncInstallationStore):
     This class is an implementation of the InstallationStore interface that uses MongoDB as a backend. It stores installation data in a collection called 'installations' in a database called 'slack'.
     """
 
+    INDEXES = [
+        {"keys": [("user_id", ASCENDING)]},
+        {"keys": [("team_id", ASCENDING), ("enterprise_id", ASCENDING)]},
+    ]
+
     def __init__(
         self,
-        motor_client: AsyncIOMotorClient,
+        get_motor_client: Callable[[], AsyncIOMotorClient],
         db_name: str = "slack",
         collection_name: str = "installations",
+        token_cache: Optional[TTLCache] = None,
+        get_user_settings: Optional[Callable[[], UserSettingsCache]] = None,
     ):
-        """Initialises the MongoDBInstallationStore
+        """Initialises the MongoDBInstallationStore. The Motor client and user settings cache are only requested when the store is first used
 
         Keyword arguments:
-        motor_client -- The Montor client
+        get_motor_client -- A function returning the Motor client
         db_name -- The name of the database (default 'slack')
         collection_name -- The name of the collection (default 'installations')
+        token_cache -- The token validity cache to mark newly saved user tokens as valid in (default None)
+        get_user_settings -- A function returning the user settings cache to apply changes to the users collection to (default None)
         """
-        self.motor_client = motor_client
-        self.db = motor_client[db_name]
-        self.collection = self.db[collection_name]
+        self.get_motor_client = get_motor_client
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.token_cache = token_cache
+        self.get_user_settings = get_user_settings
+
+    @cached_property
+    def motor_client(self) -> AsyncIOMotorClient:
+        return self.get_motor_client()
+
+    @cached_property
+    def db(self):
+        return self.motor_client[self.db_name]
+
+    @cached_property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    @cached_property
+    def user_settings(self) -> Optional[UserSettingsCache]:
+        return self.get_user_settings() if self.get_user_settings else None
 
     async def async_save(self, installation: Installation):
         """Saves the installation data for a user to the database
@@ -55,6 +88,13 @@ class MongoDBInstallationStore(AsyncInstallationStore):
             {"$set": {"user_id": installation.user_id, "enabled": True}},
             upsert=True,
         )
+        if installation.user_id and self.user_settings is not None:
+            self.user_settings.update(
+                installation.user_id,
+                {"user_id": installation.user_id, "enabled": True},
+            )
+        if self.token_cache is not None and installation.user_token:
+            self.token_cache.set(installation.user_token, True)
 
     async def async_find_bot(
         self,
@@ -161,6 +201,8 @@ class MongoDBInstallationStore(AsyncInstallationStore):
             query = {"enterprise_id": enterprise_id}
         await self.collection.delete_one(query)
         await self.motor_client["slickstats"].users.delete_one({"user_id": user_id})
+        if user_id and self.user_settings is not None:
+            self.user_settings.delete(user_id)
 
     async def async_find_installations(
         self, *, enterprise_id: Optional[str] = None, team_id: Optional[str] = None
@@ -183,3 +225,21 @@ class MongoDBInstallationStore(AsyncInstallationStore):
             {k: v for k, v in record.items() if k != "_id"} for record in records
         ]
         return [Installation(**record) for record in records]
+
+    async def async_preload_installations(
+        self, user_ids: list[str]
+    ) -> dict[str, Installation]:
+        """Loads the installation data for all given users in a single query. The result isn't kept, so callers should only use it briefly (e.g. for one updater tick) and look installations up with `async_find_installation` otherwise
+
+        Keyword arguments:
+
+        user_ids -- The user IDs to load the installations of
+
+        Returns a dictionary of Installation objects keyed by user ID. Users without an installation are left out
+        """
+        records = await self.collection.find({"user_id": {"$in": user_ids}}).to_list()
+        installations = {}
+        for record in records:
+            record.pop("_id", None)
+            installations[record["user_id"]] = Installation(**record)
+        return installations
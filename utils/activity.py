@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+
+from utils.env import env
+from utils.metrics import ACTIVITY_LOG_LINES
+from utils.slack import get_slack_user
+from utils.slack import log_to_slack
+
+# Slack cuts off longer messages, so combined digests are split well before that
+MAX_DIGEST_LENGTH = 3000
+
+
+class ActivityLog:
+    """Posts activity lines (e.g. "is listening to ...") to the log channel in the background
+
+    Lines are queued without waiting and posted in digests once per interval. Each user's lines are posted as one message under their name and avatar. When more users are active in an interval than the channel's roughly one message per second allows, all lines are combined into a single digest instead. If the queue is full, new lines are dropped rather than slowing down their callers.
+    """
+
+    def __init__(self, max_size: int, interval: float):
+        """Initialises the ActivityLog
+
+        Keyword arguments:
+
+        max_size -- The maximum number of lines waiting to be posted
+
+        interval -- The time in seconds lines are collected for before being posted
+        """
+        self.interval = interval
+        self.queue: asyncio.Queue[tuple[str, str, str, bool]] = asyncio.Queue(
+            maxsize=max_size
+        )
+        # Lines taken off the queue for the digest that is being collected
+        self.pending: list[tuple[str, str, str, bool]] = []
+
+    def log(self, user_id: str, message: str, token: str, with_name: bool = False):
+        """Queues an activity line to be posted
+
+        Keyword arguments:
+
+        user_id -- The Slack ID of the user the line is about
+
+        message -- The line to post
+
+        token -- The Slack API token to post with
+
+        with_name -- If True, the user's display name is put in front of the line (default False)
+        """
+        try:
+            self.queue.put_nowait((user_id, message, token, with_name))
+            ACTIVITY_LOG_LINES.labels(result="queued").inc()
+        except asyncio.QueueFull:
+            ACTIVITY_LOG_LINES.labels(result="dropped").inc()
+            logging.warning(f"Activity log is full, dropping line for {user_id}")
+
+    async def run(self):
+        """Posts queued lines every `interval` seconds, waiting for the first line of each digest"""
+        while True:
+            self.pending = [await self.queue.get()]
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lines = self.take()
+            posts = 0
+            try:
+                posts = await self.post(lines)
+            except Exception as e:
+                logging.error(f"Failed to post activity log: {e}")
+            # Never post more than about once per second on average
+            await asyncio.sleep(max(0.0, posts - (time.monotonic() - started)))
+
+    def take(self) -> list[tuple[str, str, str, bool]]:
+        """Returns the pending lines and everything still queued, leaving both empty"""
+        lines, self.pending = self.pending, []
+        while not self.queue.empty():
+            lines.append(self.queue.get_nowait())
+        return lines
+
+    async def flush(self, timeout: float = 10):
+        """Posts every line that hasn't been posted yet. Meant for shutdown, once `run` has been cancelled
+
+        Keyword arguments:
+
+        timeout -- The longest time in seconds to spend posting (default 10)
+        """
+        lines = self.take()
+        if not lines:
+            return
+        try:
+            await asyncio.wait_for(self.post(lines), timeout)
+        except Exception as e:
+            logging.error(f"Failed to post activity log on shutdown: {e}")
+
+    async def post(self, lines: list[tuple[str, str, str, bool]]) -> int:
+        """Posts a batch of lines, one message per user if the posting limit allows it and as a combined digest otherwise. Returns the number of messages posted
+
+        Keyword arguments:
+
+        lines -- The queued (user ID, message, token, with name) lines
+        """
+        users: dict[str, list[tuple[str, str, bool]]] = {}
+        for user_id, message, token, with_name in lines:
+            users.setdefault(user_id, []).append((message, token, with_name))
+
+        slack_users = {}
+        for user_id in users:
+            try:
+                slack_users[user_id] = await get_slack_user(user_id)
+            except Exception as e:
+                logging.error(f"Failed to look up {user_id} for the activity log: {e}")
+                slack_users[user_id] = {"display_name": user_id, "image_512": None}
+
+        if len(users) <= max(1, int(self.interval)):
+            for user_id, user_lines in users.items():
+                slack_user = slack_users[user_id]
+                await log_to_slack(
+                    "\n".join(
+                        f"{slack_user['display_name']} {message}"
+                        if with_name
+                        else message
+                        for message, _, with_name in user_lines
+                    ),
+                    user_lines[0][1],
+                    pfp=slack_user["image_512"],
+                    username=slack_user["display_name"],
+                )
+            return len(users)
+
+        digest = []
+        for user_id, user_lines in users.items():
+            display = slack_users[user_id]["display_name"]
+            for message, _, with_name in user_lines:
+                digest.append(
+                    f"{display} {message}" if with_name else f"*{display}*: {message}"
+                )
+        chunks = [""]
+        for line in digest:
+            if chunks[-1] and len(chunks[-1]) + len(line) + 1 > MAX_DIGEST_LENGTH:
+                chunks.append("")
+            chunks[-1] = f"{chunks[-1]}\n{line}" if chunks[-1] else line
+        for chunk in chunks:
+            await log_to_slack(chunk, env.slack_token)
+        return len(chunks)
+
+
+activity_log = ActivityLog(
+    max_size=env.activity_log_queue_size, interval=env.activity_log_interval
+)
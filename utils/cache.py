@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+from utils.metrics import CACHE_REQUESTS
+
+
+class TTLCache:
+    """An in-memory cache whose entries expire a fixed time after being set
+
+    If a maximum size is given, the least recently used entries are evicted once it is exceeded.
+    """
+
+    def __init__(
+        self, ttl: float, max_size: int | None = None, name: str | None = None
+    ):
+        """Initialises the TTLCache
+
+        Keyword arguments:
+
+        ttl -- The time in seconds an entry stays valid for
+
+        max_size -- The maximum number of entries to keep (default None, unbounded)
+
+        name -- The name to report hits and misses under in the metrics (default None, not reported)
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.name = name
+        self.entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key, default=None):
+        """Returns the value cached for the key, or the default if it is missing or expired
+
+        Keyword arguments:
+
+        key -- The key to look up
+
+        default -- The value to return if there is no valid entry (default None)
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self.entries[key]
+            entry = None
+        if self.name:
+            CACHE_REQUESTS.labels(
+                cache=self.name, result="miss" if entry is None else "hit"
+            ).inc()
+        if entry is None:
+            return default
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value):
+        """Caches the value for the key, replacing any existing entry
+
+        Keyword arguments:
+
+        key -- The key to cache the value under
+
+        value -- The value to cache
+        """
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        if self.max_size is not None:
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Removes the key from the cache and returns its value, or the default if it wasn't cached
+
+        Keyword arguments:
+
+        key -- The key to remove
+
+        default -- The value to return if there is no entry (default None)
+        """
+        entry = self.entries.pop(key, None)
+        return entry[1] if entry else default
+
+    def clear(self):
+        """Removes every entry from the cache"""
+        self.entries.clear()
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+_MISSING = object()
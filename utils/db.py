@@ -1,8 +1,127 @@
+import contextlib
+import logging
+from contextvars import ContextVar
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING
+from pymongo import ReturnDocument
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
 from utils.env import env
 
 
+UPDATER_FIELDS = [
+    "user_id",
+    "enabled",
+    "in_huddle",
+    "pfp",
+    "current_song",
+    "current_game",
+    "current_jellyfin",
+    "lastfm_username",
+    "lastfm_api_key",
+    "steam_id",
+    "steam_api_key",
+    "jellyfin_url",
+    "jellyfin_api_key",
+    "jellyfin_username",
+    "music_emoji",
+    "gaming_emoji",
+    "film_emoji",
+    "huddle_emoji",
+    "default_pfp",
+    "huddle_pfp",
+    "music_pfp",
+    "film_pfp",
+    "gaming_pfp",
+]
+
+USER_INDEXES = [{"keys": [("user_id", ASCENDING)], "unique": True}]
+
+# Only the updater writes these, so a buffered write can't overwrite a change made elsewhere during the tick
+BUFFERED_FIELDS = ["current_song", "current_game", "current_jellyfin"]
+
+
+class UserWriteBuffer:
+    """Collects the changes the updater makes to users' `BUFFERED_FIELDS` during a tick so they can be written in a single bulk write
+
+    Changes that would write the value a user's document already had when it was loaded are dropped when flushing.
+    """
+
+    def __init__(self, users: list[dict]):
+        """Initialises the UserWriteBuffer
+
+        Keyword arguments:
+
+        users -- The users' documents as loaded at the start of the tick
+        """
+        self.documents = {user.get("user_id"): user for user in users}
+        self.pending: dict[str, dict] = {}
+
+    def update(self, user_id: str, data: dict):
+        """Queues the data to be written to the user's document when the buffer is flushed
+
+        Keyword arguments:
+
+        user_id -- The user's ID
+
+        data -- The data to be updated in the DB
+        """
+        self.pending.setdefault(user_id, {}).update(data)
+
+    async def flush(self):
+        """Writes all queued changes that differ from the loaded documents in one unordered bulk write"""
+        changed = {}
+        for user_id, data in self.pending.items():
+            document = self.documents.get(user_id, {})
+            changes = {
+                key: value for key, value in data.items() if document.get(key) != value
+            }
+            if changes:
+                changed[user_id] = changes
+        self.pending = {}
+        if not changed:
+            return
+
+        client = env.motor_client
+        db = client["slickstats"]
+        users = db.users
+        await users.bulk_write(
+            [
+                UpdateOne({"user_id": user_id}, {"$set": changes}, upsert=True)
+                for user_id, changes in changed.items()
+            ],
+            ordered=False,
+        )
+        for user_id, changes in changed.items():
+            env.user_settings.update(user_id, changes)
+
+
+write_buffer: ContextVar[UserWriteBuffer | None] = ContextVar(
+    "write_buffer", default=None
+)
+
+
+@contextlib.asynccontextmanager
+async def buffered_user_writes(users: list[dict]):
+    """Buffers the `BUFFERED_FIELDS` of every `update_user_settings` call made inside the context (including in tasks started from it) and flushes them when it exits
+
+    Keyword arguments:
+
+    users -- The users' documents as loaded at the start of the tick
+    """
+    buffer = UserWriteBuffer(users)
+    token = write_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        write_buffer.reset(token)
+        await buffer.flush()
+
+
 async def update_user_settings(user_id: str, data: dict):
-    """Updates the user settings in the DB via an upsert operation
+    """Updates the user settings in the DB via an upsert operation. Inside `buffered_user_writes` the `BUFFERED_FIELDS` are queued instead and any other fields are still written straight away
 
     Keyword arguments:
 
@@ -10,35 +129,119 @@ async def update_user_settings(user_id: str, data: dict):
 
     data -- The data to be updated in the DB
     """
+    buffer = write_buffer.get()
+    if buffer is not None:
+        buffered = {key: data[key] for key in BUFFERED_FIELDS if key in data}
+        if buffered:
+            buffer.update(user_id, buffered)
+        data = {key: value for key, value in data.items() if key not in buffered}
+        if not data:
+            return
+
     client = env.motor_client
     db = client["slickstats"]
     users = db.users
     await users.update_one({"user_id": user_id}, {"$set": data}, upsert=True)
+    env.user_settings.update(user_id, data)
 
 
-async def get_all_users(enabled: bool = False):
-    """Returns a list of all users from the DB that have the app enabled if enabled is True
+async def save_user_settings(user_id: str, data: dict) -> dict:
+    """Updates the user settings in the DB via an upsert operation and returns the user's settings after the update, in a single round trip
 
     Keyword arguments:
 
-    enabled -- If True, only returns users that have the app enabled (default False)
+    user_id -- The user's ID
+
+    data -- The data to be updated in the DB
     """
     client = env.motor_client
     db = client["slickstats"]
     users = db.users
-    all_users = await users.find().to_list()
-    if enabled:
-        return [user for user in all_users if user.get("enabled", True)]
+    user = await users.find_one_and_update(
+        {"user_id": user_id},
+        {"$set": data},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    env.user_settings.set(user)
+    return dict(user)
+
+
+async def get_all_users(enabled: bool = False, projection: list[str] | None = None):
+    """Returns a list of all users from the settings cache that have the app enabled if enabled is True. The cache is loaded from the DB first if it hasn't been yet
+
+    Keyword arguments:
+
+    enabled -- If True, only returns users that have the app enabled (default False)
+
+    projection -- The fields to return for each user, or None for all fields (default None)
+    """
+    if not env.user_settings.loaded:
+        await env.user_settings.load()
+    return env.user_settings.all(enabled=enabled, projection=projection)
 
 
 async def get_user_settings(user_id: str):
-    """Returns the user's settings from the DB
+    """Returns the user's settings from the settings cache. Users missing from it are looked up in the DB unless the cache is being kept current by its change stream
 
     Keyword arguments:
 
     user_id -- The user's ID
     """
+    user = env.user_settings.get(user_id)
+    if user or env.user_settings.watching:
+        return user
+
     client = env.motor_client
     db = client["slickstats"]
     users = db.users
-    return await users.find_one({"user_id": user_id})
+    user = await users.find_one({"user_id": user_id})
+    if user:
+        env.user_settings.set(user)
+        user = dict(user)
+    return user
+
+
+async def ensure_indexes():
+    """Creates the indexes the users and installations queries rely on if they don't exist yet and logs any that are still missing afterwards"""
+    client = env.motor_client
+    db = client["slickstats"]
+    await ensure_collection_indexes(db.users, USER_INDEXES)
+    await ensure_collection_indexes(
+        env.installation_store.collection, env.installation_store.INDEXES
+    )
+
+
+async def ensure_collection_indexes(
+    collection: AsyncIOMotorCollection, indexes: list[dict]
+) -> bool:
+    """Creates the given indexes on the collection and verifies that they exist. Returns True if they all do
+
+    Keyword arguments:
+
+    collection -- The collection to create the indexes on
+
+    indexes -- The indexes to create, each a dictionary with a list of (field, direction) `keys` and an optional `unique` flag
+    """
+    for index in indexes:
+        try:
+            await collection.create_index(
+                index["keys"], unique=index.get("unique", False)
+            )
+        except OperationFailure as e:
+            logging.error(
+                f"Failed to create index {index['keys']} on {collection.name}: {e}"
+            )
+
+    existing = [
+        (info["key"], info.get("unique", False))
+        for info in (await collection.index_information()).values()
+    ]
+    missing = [
+        index
+        for index in indexes
+        if (index["keys"], index.get("unique", False)) not in existing
+    ]
+    for index in missing:
+        logging.error(f"Index {index['keys']} is missing on {collection.name}")
+    return not missing
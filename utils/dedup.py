@@ -0,0 +1,66 @@
+import logging
+from datetime import datetime
+from datetime import timezone
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import DuplicateKeyError
+from pymongo.errors import PyMongoError
+
+from utils.cache import TTLCache
+
+
+class EventDeduplicator:
+    """Remembers which Slack events have already been handled so retries and duplicate deliveries are only processed once
+
+    Keys are kept in an in-memory TTLCache for fast repeat lookups. If a Mongo collection is given, keys are also inserted into it with a unique _id, so only one process can claim an event, and a TTL index expires them.
+    """
+
+    def __init__(
+        self,
+        ttl: int,
+        max_size: int,
+        collection: AsyncIOMotorCollection | None = None,
+    ):
+        """Initialises the EventDeduplicator
+
+        Keyword arguments:
+
+        ttl -- The time in seconds an event is remembered for
+
+        max_size -- The maximum number of events remembered in memory
+
+        collection -- The Mongo collection shared between processes (default None, in-memory only)
+        """
+        self.ttl = ttl
+        self.cache = TTLCache(ttl=ttl, max_size=max_size, name="event_dedup")
+        self.collection = collection
+
+    async def seen(self, key: str) -> bool:
+        """Returns True if the event has already been handled, otherwise records it as handled and returns False. If the event can't be recorded in the Mongo collection it is treated as not handled
+
+        Keyword arguments:
+
+        key -- A key identifying the event (e.g. its event_ts)
+        """
+        if key in self.cache:
+            return True
+        if self.collection is not None:
+            try:
+                await self.collection.insert_one(
+                    {"_id": key, "created_at": datetime.now(timezone.utc)}
+                )
+            except DuplicateKeyError:
+                self.cache.set(key, True)
+                return True
+            except PyMongoError as e:
+                # Handling an event twice is better than never handling it, and a retry may be able to claim it
+                logging.error(f"Failed to record event {key}: {e}")
+                return False
+        self.cache.set(key, True)
+        return False
+
+    async def ensure_indexes(self):
+        """Creates the TTL index that expires old events in the Mongo collection"""
+        if self.collection is None:
+            return
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl)
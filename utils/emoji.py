@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+
+from utils.env import env
+from utils.metrics import CACHE_REQUESTS
+
+
+class EmojiCatalogue:
+    """A cached, searchable catalogue of the workspace's custom emojis
+
+    The emoji list is fetched with emoji.list at most once per TTL and kept current by emoji_changed events. Searches run against a sorted name list for prefix matches and a bigram index for substring matches, so they never touch the network. Once the list has expired, searches keep using it while it is refreshed in the background.
+    """
+
+    def __init__(self, ttl: int):
+        """Initialises the EmojiCatalogue
+
+        Keyword arguments:
+
+        ttl -- The time in seconds before the emoji list is fetched again
+        """
+        self.ttl = ttl
+        self.expires = 0.0
+        self.names: list[str] = []
+        self.bigrams: dict[str, set[int]] = {}
+        self.options: list[dict] = []
+        self.loaded = False
+        self.refreshing: asyncio.Task | None = None
+
+    async def refresh(self):
+        """Fetches the emoji list and rebuilds the search index. If the request fails it is tried again by the first search a minute later"""
+        try:
+            emojis_info = await env.slack_client.emoji_list()
+        except Exception as e:
+            logging.error(f"Failed to fetch the emoji list: {e}")
+            self.expires = time.monotonic() + min(60, self.ttl)
+            return
+        self.build(emojis_info.get("emoji", {}))
+        self.loaded = True
+        self.expires = time.monotonic() + self.ttl
+
+    def start_refresh(self) -> asyncio.Task:
+        """Starts a background refresh unless one is already running and returns its task"""
+        if self.refreshing is None or self.refreshing.done():
+            self.refreshing = asyncio.create_task(self.refresh())
+        return self.refreshing
+
+    def build(self, emojis):
+        """Rebuilds the search index from the given emoji names
+
+        Keyword arguments:
+
+        emojis -- The emoji names (e.g. the keys of emoji.list's `emoji` field)
+        """
+        self.names = sorted(emojis)
+        self.bigrams = {}
+        for i, name in enumerate(self.names):
+            for j in range(len(name) - 1):
+                self.bigrams.setdefault(name[j : j + 2], set()).add(i)
+        self.options = [
+            {
+                "text": {"type": "plain_text", "text": f":{name}: {name}"},
+                "value": f":{name}:",
+            }
+            for name in self.names
+        ]
+
+    def add(self, names: list[str]):
+        """Adds emojis to the catalogue. Ignored until the emoji list has been fetched, as it will include them
+
+        Keyword arguments:
+
+        names -- The emoji names to add
+        """
+        if not self.loaded:
+            return
+        self.build(set(self.names) | set(names))
+
+    def remove(self, names: list[str]):
+        """Removes emojis from the catalogue. Ignored until the emoji list has been fetched, as it won't include them
+
+        Keyword arguments:
+
+        names -- The emoji names to remove
+        """
+        if not self.loaded:
+            return
+        self.build(set(self.names) - set(names))
+
+    async def search(self, keyword: str | None, limit: int = 100) -> list[dict]:
+        """Returns up to `limit` emoji options matching the keyword, starting a background refresh if the catalogue has expired. Prefix matches come first (so an exact match is always first), then other substring matches, each alphabetically
+
+        Keyword arguments:
+
+        keyword -- The text to search for, or None to return the first emojis alphabetically
+
+        limit -- The maximum number of options to return (default 100)
+        """
+        if time.monotonic() >= self.expires:
+            CACHE_REQUESTS.labels(cache="emoji", result="miss").inc()
+            self.start_refresh()
+        else:
+            CACHE_REQUESTS.labels(cache="emoji", result="hit").inc()
+
+        keyword = (keyword or "").strip(":").lower()
+        if not keyword:
+            return self.options[:limit]
+
+        start = bisect_left(self.names, keyword)
+        prefix = []
+        for i in range(start, len(self.names)):
+            if not self.names[i].startswith(keyword) or len(prefix) >= limit:
+                break
+            prefix.append(i)
+
+        if len(prefix) < limit:
+            if len(keyword) > 1:
+                candidates = set.intersection(
+                    *(
+                        self.bigrams.get(keyword[j : j + 2], set())
+                        for j in range(len(keyword) - 1)
+                    )
+                )
+            else:
+                candidates = range(len(self.names))
+            substring = sorted(
+                i
+                for i in candidates
+                if keyword in self.names[i] and not self.names[i].startswith(keyword)
+            )
+            prefix += substring[: limit - len(prefix)]
+
+        return [self.options[i] for i in prefix]
+
+
+emoji_catalogue = EmojiCatalogue(ttl=env.emoji_cache_ttl)
@@ -1,20 +1,52 @@
 import os
+from functools import cached_property
 
+from aiohttp import ClientSession
 from dotenv import load_dotenv
-from git import Repo
 from motor.motor_asyncio import AsyncIOMotorClient
 from slack_sdk.web.async_client import AsyncWebClient
 
+from utils.cache import TTLCache
+from utils.metrics import MongoMetricsListener
+from utils.metrics import SlackMetricsHandler
 from utils.MongoDBInstallatonStore import MongoDBInstallationStore
+from utils.settings import UserSettingsCache
 
 load_dotenv()
 
 
 def get_git_hash(repo_path="."):
-    try:
-        repo = Repo(repo_path)
-        commit_hash = repo.head.commit.hexsha
+    """Returns the short hash of the deployed commit from the GIT_HASH environment variable, or by reading it from the repository's .git directory. Returns None if neither is available
+
+    Keyword arguments:
+
+    repo_path -- The path to the repository (default ".")
+    """
+    commit_hash = os.environ.get("GIT_HASH")
+    if commit_hash:
         return commit_hash[:7]
+    try:
+        git_dir = os.path.join(repo_path, ".git")
+        if os.path.isfile(git_dir):
+            # Worktrees and submodules point to their git directory from a file
+            with open(git_dir) as f:
+                git_dir = os.path.join(
+                    repo_path, f.read().removeprefix("gitdir:").strip()
+                )
+        with open(os.path.join(git_dir, "HEAD")) as f:
+            head = f.read().strip()
+        if not head.startswith("ref:"):
+            return head[:7]
+        ref = head.removeprefix("ref:").strip()
+        ref_path = os.path.join(git_dir, ref)
+        if os.path.exists(ref_path):
+            with open(ref_path) as f:
+                return f.read().strip()[:7]
+        with open(os.path.join(git_dir, "packed-refs")) as f:
+            for line in f:
+                if line.rstrip("\n").endswith(f" {ref}"):
+                    return line.split(" ")[0][:7]
+        raise ValueError(f"{ref} not found")
     except Exception as e:
         print(f"Error getting git hash: {e}")
         return None
@@ -43,17 +75,96 @@ class Environment:
         self.environment = os.environ.get("ENV", "development")
         self.port = int(os.environ.get("PORT", 3000))
 
+        self.updater_concurrency = int(os.environ.get("UPDATER_CONCURRENCY", 10))
+        self.poll_min_interval = int(os.environ.get("POLL_MIN_INTERVAL", 35))
+        self.poll_max_interval = int(os.environ.get("POLL_MAX_INTERVAL", 600))
+
+        self.updater_sharding = (
+            os.environ.get("UPDATER_SHARDING", "false").lower() == "true"
+        )
+        self.updater_partitions = int(os.environ.get("UPDATER_PARTITIONS", 64))
+        self.updater_lease_ttl = int(os.environ.get("UPDATER_LEASE_TTL", 60))
+
+        self.http_pool_size = int(os.environ.get("HTTP_POOL_SIZE", 100))
+        self.http_pool_per_host = int(os.environ.get("HTTP_POOL_PER_HOST", 10))
+        self.http_dns_cache_ttl = int(os.environ.get("HTTP_DNS_CACHE_TTL", 300))
+        self.http_keepalive_timeout = int(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 60))
+        self.provider_connect_timeout = float(
+            os.environ.get("PROVIDER_CONNECT_TIMEOUT", 3)
+        )
+        self.provider_read_timeout = float(os.environ.get("PROVIDER_READ_TIMEOUT", 5))
+        self.breaker_threshold = int(os.environ.get("BREAKER_THRESHOLD", 5))
+        self.breaker_reset_timeout = float(os.environ.get("BREAKER_RESET_TIMEOUT", 60))
+
+        self.image_cache_max_bytes = int(
+            os.environ.get("IMAGE_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+        )
+        # Other replicas don't see the events that invalidate a status, so it isn't cached by default when sharding
+        self.status_cache_ttl = int(
+            os.environ.get("STATUS_CACHE_TTL", 0 if self.updater_sharding else 300)
+        )
+        self.token_cache_ttl = int(os.environ.get("TOKEN_CACHE_TTL", 600))
+        self.user_directory_ttl = int(os.environ.get("USER_DIRECTORY_TTL", 86400))
+        self.user_directory_max_size = int(
+            os.environ.get("USER_DIRECTORY_MAX_SIZE", 10000)
+        )
+
+        self.event_dedup_ttl = int(os.environ.get("EVENT_DEDUP_TTL", 3600))
+        self.event_dedup_max_size = int(os.environ.get("EVENT_DEDUP_MAX_SIZE", 10000))
+        self.event_dedup_mongo = (
+            os.environ.get("EVENT_DEDUP_MONGO", "false").lower() == "true"
+        )
+
+        self.emoji_cache_ttl = int(os.environ.get("EMOJI_CACHE_TTL", 3600))
+
+        self.activity_log_queue_size = int(
+            os.environ.get("ACTIVITY_LOG_QUEUE_SIZE", 1000)
+        )
+        self.activity_log_interval = float(os.environ.get("ACTIVITY_LOG_INTERVAL", 5))
+
+        self.settings_resync_interval = int(
+            os.environ.get("SETTINGS_RESYNC_INTERVAL", 300)
+        )
+
         unset = [key for key, value in self.__dict__.items() if value == "unset"]
 
         if unset:
             raise ValueError(f"Missing environment variables: {', '.join(unset)}")
 
-        self.motor_client = AsyncIOMotorClient(self.mongo_uri)
-        self.installation_store = MongoDBInstallationStore(self.motor_client)
+        self.token_cache = TTLCache(ttl=self.token_cache_ttl, name="token")
 
-        self.slack_client = AsyncWebClient(token=self.slack_token)
+        # Created and closed by the Starlette lifespan as it needs a running event loop
+        self.http_session: ClientSession | None = None
 
         self.git_hash = get_git_hash()
 
+    # The clients are only created when first used so that importing the app stays fast. Anything built at import (e.g. the installation store) asks for them lazily too
+
+    @cached_property
+    def motor_client(self) -> AsyncIOMotorClient:
+        return AsyncIOMotorClient(
+            self.mongo_uri, event_listeners=[MongoMetricsListener()]
+        )
+
+    @cached_property
+    def user_settings(self) -> UserSettingsCache:
+        return UserSettingsCache(
+            self.motor_client["slickstats"].users, self.settings_resync_interval
+        )
+
+    @cached_property
+    def installation_store(self) -> MongoDBInstallationStore:
+        return MongoDBInstallationStore(
+            lambda: self.motor_client,
+            token_cache=self.token_cache,
+            get_user_settings=lambda: self.user_settings,
+        )
+
+    @cached_property
+    def slack_client(self) -> AsyncWebClient:
+        client = AsyncWebClient(token=self.slack_token)
+        client.retry_handlers.insert(0, SlackMetricsHandler())
+        return client
+
 
 env = Environment()
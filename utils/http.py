@@ -0,0 +1,125 @@
+import time
+
+import aiohttp
+from yarl import URL
+
+from utils.env import env
+from utils.metrics import PROVIDER_LATENCY
+
+PROVIDER_TIMEOUT = aiohttp.ClientTimeout(
+    total=env.provider_connect_timeout + env.provider_read_timeout,
+    connect=env.provider_connect_timeout,
+    sock_read=env.provider_read_timeout,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request to a host whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops requests to an upstream host after repeated failures
+
+    After `threshold` consecutive failures the breaker opens and requests fail immediately. Once `reset_timeout` seconds have passed it goes half-open and lets a single probe request through, closing again if it succeeds or reopening if it fails.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        """Initialises the CircuitBreaker
+
+        Keyword arguments:
+
+        threshold -- The number of consecutive failures that open the breaker
+
+        reset_timeout -- The time in seconds the breaker stays open before a probe is allowed
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    def allow(self) -> bool:
+        """Returns True if a request may be made now"""
+        if self.opened_at is None:
+            return True
+        if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self):
+        """Closes the breaker after a successful request"""
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        """Counts a failed request, opening the breaker if there have been too many"""
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+breakers: dict[str, CircuitBreaker] = {}
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Creates the app-wide HTTP session used to poll the status providers
+
+    Connections are kept alive between ticks and DNS lookups are cached, so polling reuses warm connections instead of doing a fresh TCP/TLS handshake for every request.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=env.http_pool_size,
+        limit_per_host=env.http_pool_per_host,
+        ttl_dns_cache=env.http_dns_cache_ttl,
+        keepalive_timeout=env.http_keepalive_timeout,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def fetch_json(
+    session: aiohttp.ClientSession,
+    url: str,
+    provider: str,
+    headers: dict | None = None,
+    timeout: aiohttp.ClientTimeout = PROVIDER_TIMEOUT,
+):
+    """Makes a GET request to a status provider and returns the JSON response, guarded by a timeout and the host's circuit breaker
+
+    Only timeouts, connection errors and 5xx responses count as failures, so one user's bad credentials can't open the breaker for everyone using the same host.
+
+    Keyword arguments:
+
+    session -- The shared HTTP session to make the request with
+
+    url -- The URL to request
+
+    provider -- The name of the provider to report the request's latency under
+
+    headers -- Extra headers to send (default None)
+
+    timeout -- The connect and read timeouts for the request (default PROVIDER_TIMEOUT)
+
+    Raises CircuitOpenError without making a request if the host's breaker is open.
+    """
+    host = str(URL(url).origin())
+    breaker = breakers.setdefault(
+        host, CircuitBreaker(env.breaker_threshold, env.breaker_reset_timeout)
+    )
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit breaker for {host} is open")
+
+    reached = False
+    start = time.monotonic()
+    try:
+        async with session.get(url, headers=headers, timeout=timeout) as res:
+            if res.status >= 500:
+                res.raise_for_status()
+            reached = True
+            breaker.record_success()
+            return await res.json()
+    finally:
+        if not reached:
+            breaker.record_failure()
+        PROVIDER_LATENCY.labels(provider=provider).observe(time.monotonic() - start)
@@ -0,0 +1,110 @@
+import hashlib
+from collections import OrderedDict
+
+import aiohttp
+
+from utils.env import env
+from utils.http import PROVIDER_TIMEOUT
+from utils.metrics import CACHE_REQUESTS
+
+
+class ImageCache:
+    """A size-bounded LRU cache of downloaded profile pictures
+
+    Images are keyed by URL and stored by the SHA-256 digest of their content, so the same image behind several URLs is only kept once. Cached URLs are revalidated with their ETag/Last-Modified headers instead of being downloaded again.
+    """
+
+    def __init__(self, max_bytes: int):
+        """Initialises the ImageCache
+
+        Keyword arguments:
+
+        max_bytes -- The maximum total size of the cached images
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+        self.blobs: dict[str, bytes] = {}
+        self.references: dict[str, int] = {}
+        self.uploaded: dict[str, str] = {}
+
+    async def fetch(
+        self, session: aiohttp.ClientSession, url: str
+    ) -> tuple[bytes, str] | None:
+        """Returns a tuple with the image's content and digest, downloading it only if it isn't cached or has changed. If the URL doesn't point to a valid image, returns None
+
+        Keyword arguments:
+
+        session -- The shared HTTP session to make the request with
+
+        url -- The URL of the image
+        """
+        entry = self.entries.get(url)
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        async with session.get(url, headers=headers, timeout=PROVIDER_TIMEOUT) as res:
+            if res.status == 304 and entry:
+                CACHE_REQUESTS.labels(cache="image", result="hit").inc()
+                self.entries.move_to_end(url)
+                return self.blobs[entry["digest"]], entry["digest"]
+            CACHE_REQUESTS.labels(cache="image", result="miss").inc()
+            if res.status != 200 or "image" not in res.headers.get("Content-Type", ""):
+                return None
+            content = await res.read()
+            etag = res.headers.get("ETag")
+            last_modified = res.headers.get("Last-Modified")
+
+        digest = hashlib.sha256(content).hexdigest()
+        self._remove(url)
+        if len(content) <= self.max_bytes:
+            if digest not in self.blobs:
+                self.blobs[digest] = content
+                self.size += len(content)
+            self.references[digest] = self.references.get(digest, 0) + 1
+            self.entries[url] = {
+                "digest": digest,
+                "etag": etag,
+                "last_modified": last_modified,
+            }
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+        return content, digest
+
+    def is_uploaded(self, user_id: str, digest: str) -> bool:
+        """Returns True if the image with the given digest is the last one uploaded for the user
+
+        Keyword arguments:
+
+        user_id -- The user's Slack ID
+
+        digest -- The digest returned by `fetch`
+        """
+        return self.uploaded.get(user_id) == digest
+
+    def mark_uploaded(self, user_id: str, digest: str):
+        """Records the image with the given digest as the last one uploaded for the user
+
+        Keyword arguments:
+
+        user_id -- The user's Slack ID
+
+        digest -- The digest returned by `fetch`
+        """
+        self.uploaded[user_id] = digest
+
+    def _remove(self, url: str):
+        entry = self.entries.pop(url, None)
+        if not entry:
+            return
+        digest = entry["digest"]
+        self.references[digest] -= 1
+        if self.references[digest] == 0:
+            del self.references[digest]
+            self.size -= len(self.blobs.pop(digest))
+
+
+image_cache = ImageCache(max_bytes=env.image_cache_max_bytes)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import socket
+import zlib
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from uuid import uuid4
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import DuplicateKeyError
+
+from utils.env import env
+
+
+class PartitionLeases:
+    """Shares the updater's users between replicas through lease documents in MongoDB
+
+    Users are split into a fixed number of partitions by a stable hash of their ID. Every replica heartbeats a document in the replicas collection, renews the partition leases it holds, releases any above its fair share and claims expired leases up to that share. When a replica dies, its leases expire and the remaining replicas claim them.
+    """
+
+    def __init__(
+        self,
+        leases: AsyncIOMotorCollection,
+        replicas: AsyncIOMotorCollection,
+        partitions: int,
+        lease_ttl: int,
+    ):
+        """Initialises the PartitionLeases
+
+        Keyword arguments:
+
+        leases -- The collection holding one lease document per partition
+
+        replicas -- The collection holding one heartbeat document per replica
+
+        partitions -- The number of partitions users are split into
+
+        lease_ttl -- The time in seconds a lease or heartbeat stays valid without being renewed
+        """
+        self.leases = leases
+        self.replicas = replicas
+        self.partitions = partitions
+        self.lease_ttl = lease_ttl
+        self.replica_id = f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:8]}"
+        self.owned: set[int] = set()
+        self.valid_until = datetime.min.replace(tzinfo=timezone.utc)
+
+    def partition_of(self, user_id: str) -> int:
+        """Returns the partition the user belongs to
+
+        Keyword arguments:
+
+        user_id -- The user's Slack ID
+        """
+        return zlib.crc32(user_id.encode()) % self.partitions
+
+    def owns(self, user_id: str) -> bool:
+        """Returns True if this replica currently holds the lease for the user's partition
+
+        Keyword arguments:
+
+        user_id -- The user's Slack ID
+        """
+        if datetime.now(timezone.utc) >= self.valid_until:
+            return False
+        return self.partition_of(user_id) in self.owned
+
+    async def heartbeat(self):
+        """Registers this replica as alive, then renews, releases and claims leases so it holds its fair share of partitions"""
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=self.lease_ttl)
+
+        await self.replicas.update_one(
+            {"_id": self.replica_id},
+            {"$set": {"expires_at": expires_at}},
+            upsert=True,
+        )
+        replicas = await self.replicas.count_documents({"expires_at": {"$gt": now}})
+        share = math.ceil(self.partitions / max(1, replicas))
+
+        await self.leases.update_many(
+            {"owner": self.replica_id, "expires_at": {"$gt": now}},
+            {"$set": {"expires_at": expires_at}},
+        )
+        owned = {
+            lease["_id"]
+            async for lease in self.leases.find(
+                {"owner": self.replica_id, "expires_at": {"$gt": now}}
+            )
+        }
+
+        while len(owned) > share:
+            partition = owned.pop()
+            await self.leases.update_one(
+                {"_id": partition, "owner": self.replica_id},
+                {"$set": {"owner": None, "expires_at": now}},
+            )
+
+        # Start at a random partition so replicas don't all race for the same leases
+        offset = random.randrange(self.partitions)
+        for i in range(self.partitions):
+            if len(owned) >= share:
+                break
+            partition = (offset + i) % self.partitions
+            if partition in owned:
+                continue
+            try:
+                await self.leases.update_one(
+                    {"_id": partition, "expires_at": {"$lte": now}},
+                    {"$set": {"owner": self.replica_id, "expires_at": expires_at}},
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                # Another replica holds an unexpired lease on this partition
+                continue
+            owned.add(partition)
+
+        self.owned = owned
+        self.valid_until = expires_at
+
+    async def run(self):
+        """Heartbeats every third of the lease TTL, forever. The first heartbeat should already have been attempted so the updater starts with its partitions"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logging.error(f"Failed to renew updater partition leases: {e}")
+
+    async def ensure_indexes(self):
+        """Creates the TTL index that removes the heartbeat documents of dead replicas"""
+        await self.replicas.create_index("expires_at", expireAfterSeconds=0)
+
+
+# Only created when sharding, so MongoDB isn't touched at import otherwise
+partition_leases = (
+    PartitionLeases(
+        leases=env.motor_client["slickstats"].leases,
+        replicas=env.motor_client["slickstats"].replicas,
+        partitions=env.updater_partitions,
+        lease_ttl=env.updater_lease_ttl,
+    )
+    if env.updater_sharding
+    else None
+)
@@ -0,0 +1,88 @@
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from pymongo import monitoring
+from slack_sdk.http_retry.async_handler import AsyncRetryHandler
+from slack_sdk.http_retry.async_handler import HttpRequest
+from slack_sdk.http_retry.async_handler import HttpResponse
+from slack_sdk.http_retry.async_handler import RetryState
+
+TICK_DURATION = Histogram(
+    "slickstats_tick_duration_seconds",
+    "Time taken by each updater tick",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 35, 60, 120, 300),
+)
+TICK_LAG = Gauge(
+    "slickstats_tick_lag_seconds", "How late the last updater tick started"
+)
+TICKS_SKIPPED = Counter(
+    "slickstats_ticks_skipped_total",
+    "Updater ticks skipped because the previous one was still running or the scheduler fell behind",
+)
+PROVIDER_LATENCY = Histogram(
+    "slickstats_provider_request_duration_seconds",
+    "Time taken by requests to the status providers",
+    ["provider"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+SLACK_API_CALLS = Counter(
+    "slickstats_slack_api_calls_total",
+    "Slack API calls by method and result",
+    ["method", "result"],
+)
+MONGO_OPERATIONS = Counter(
+    "slickstats_mongo_operations_total",
+    "MongoDB commands by name and result",
+    ["command", "result"],
+)
+USERS_PROCESSED = Counter(
+    "slickstats_users_processed_total", "Users evaluated by the updater"
+)
+USERS_SKIPPED = Counter(
+    "slickstats_users_skipped_total",
+    "Users skipped by the updater by reason",
+    ["reason"],
+)
+ACTIVITY_LOG_LINES = Counter(
+    "slickstats_activity_log_lines_total",
+    "Activity log lines queued for the log channel or dropped because the queue was full",
+    ["result"],
+)
+CACHE_REQUESTS = Counter(
+    "slickstats_cache_requests_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+
+
+class SlackMetricsHandler(AsyncRetryHandler):
+    """Counts every Slack API call by method and result. Never retries the call."""
+
+    async def _can_retry_async(
+        self,
+        *,
+        state: RetryState,
+        request: HttpRequest,
+        response: HttpResponse | None = None,
+        error: Exception | None = None,
+    ) -> bool:
+        method = request.url.rsplit("/", 1)[-1]
+        if response is not None and isinstance(response.body, dict):
+            result = "ok" if response.body.get("ok") else response.body.get("error")
+        else:
+            result = type(error).__name__ if error else str(response.status_code)
+        SLACK_API_CALLS.labels(method=method, result=result or "unknown").inc()
+        return False
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """Counts every MongoDB command by name and result"""
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        MONGO_OPERATIONS.labels(command=event.command_name, result="succeeded").inc()
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        MONGO_OPERATIONS.labels(command=event.command_name, result="failed").inc()
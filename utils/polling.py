@@ -0,0 +1,72 @@
+import time
+
+from utils.env import env
+
+
+class PollingPolicy:
+    """Decides how often each user is polled by the updater
+
+    Users are polled every `min_interval` seconds while a status reports activity. Each poll that finds nothing doubles their interval, up to `max_interval`, and the interval snaps back to `min_interval` as soon as something starts playing.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 2):
+        """Initialises the PollingPolicy
+
+        Keyword arguments:
+
+        min_interval -- The interval in seconds used while a user is active
+
+        max_interval -- The longest interval in seconds an idle user backs off to
+
+        backoff -- The factor the interval grows by after each idle poll (default 2)
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self.states: dict[str, dict] = {}
+
+    def is_due(self, user_id: str) -> bool:
+        """Returns True if the user should be polled in the current tick
+
+        Keyword arguments:
+
+        user_id -- The user's Slack ID
+        """
+        state = self.states.get(user_id)
+        if not state:
+            return True
+        # Ticks don't fire at exact multiples of the interval, so allow half a tick of slack
+        return time.monotonic() + self.min_interval / 2 >= state["next_poll"]
+
+    def record(self, user_id: str, active: bool):
+        """Schedules the user's next poll based on whether the last one found any activity
+
+        Keyword arguments:
+
+        user_id -- The user's Slack ID
+
+        active -- Whether any status reported activity
+        """
+        state = self.states.get(user_id)
+        if active or not state:
+            interval = self.min_interval
+        else:
+            interval = min(state["interval"] * self.backoff, self.max_interval)
+        self.states[user_id] = {
+            "interval": interval,
+            "next_poll": time.monotonic() + interval,
+        }
+
+    def reset(self, user_id: str):
+        """Makes the user due in the next tick, e.g. after their settings change
+
+        Keyword arguments:
+
+        user_id -- The user's Slack ID
+        """
+        self.states.pop(user_id, None)
+
+
+polling_policy = PollingPolicy(
+    min_interval=env.poll_min_interval, max_interval=env.poll_max_interval
+)
@@ -0,0 +1,150 @@
+import asyncio
+import time
+from collections.abc import Callable
+from collections.abc import Hashable
+from io import IOBase
+from itertools import count
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+# Requests per minute as (for the whole app, per token), matched to Slack's rate tiers
+SLACK_RATE_LIMITS = {
+    "users.profile.set": (50, 10),  # Tier 3
+    "users.setPhoto": (20, 5),  # Tier 2
+    "chat.postMessage": (60, 60),  # Roughly one message per second per channel
+}
+
+
+class TokenBucket:
+    """A token bucket that paces calls to a fixed rate while allowing short bursts"""
+
+    def __init__(self, per_minute: float, burst: float | None = None):
+        """Initialises the TokenBucket
+
+        Keyword arguments:
+
+        per_minute -- The sustained number of calls allowed per minute
+
+        burst -- The number of calls that can be made at once (default a tenth of `per_minute`, at least 1)
+        """
+        self.rate = per_minute / 60
+        self.capacity = burst or max(1.0, per_minute / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    async def acquire(self, abandon: Callable[[], bool] | None = None) -> bool:
+        """Waits until a call is allowed and takes a token for it. Returns False without taking a token if `abandon` starts returning True while waiting
+
+        Keyword arguments:
+
+        abandon -- A function checked before taking a token, returning True if the call is no longer needed (default None)
+        """
+        while True:
+            if abandon is not None and abandon():
+                return False
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if now >= self.blocked_until and self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            await asyncio.sleep(
+                max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            )
+
+    def block(self, seconds: float):
+        """Stops any calls from being allowed for the given time, e.g. after a 429 response
+
+        Keyword arguments:
+
+        seconds -- The time in seconds to block calls for
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class SlackWriteQueue:
+    """Paces outbound Slack writes with token buckets per method and per token
+
+    Writes given the same coalesce key replace each other while they wait for the rate limit, so only the newest one is sent. Rate limited (429) responses block the method for the Retry-After time and are retried.
+    """
+
+    def __init__(self, client: AsyncWebClient, max_retries: int = 3):
+        """Initialises the SlackWriteQueue
+
+        Keyword arguments:
+
+        client -- The Slack client to send the calls with
+
+        max_retries -- The number of times a rate limited call is retried (default 3)
+        """
+        self.client = client
+        self.max_retries = max_retries
+        self.buckets: dict[tuple[str, str | None], TokenBucket] = {}
+        self.latest: dict[Hashable, int] = {}
+        self.generations = count()
+
+    def bucket(self, method: str, token: str | None) -> TokenBucket:
+        """Returns the token bucket for the method, either for the whole app if token is None or for the given token
+
+        Keyword arguments:
+
+        method -- The Slack API method (e.g. users.profile.set)
+
+        token -- The Slack API token, or None
+        """
+        key = (method, token)
+        if key not in self.buckets:
+            app_limit, token_limit = SLACK_RATE_LIMITS.get(method, (60, 60))
+            self.buckets[key] = TokenBucket(app_limit if token is None else token_limit)
+        return self.buckets[key]
+
+    async def call(
+        self, method: str, token: str, coalesce_key: Hashable | None = None, **kwargs
+    ):
+        """Sends the API call once its rate limits allow it and returns the response. Returns None if a newer call with the same coalesce key replaced it before it was sent
+
+        Keyword arguments:
+
+        method -- The Slack API method (e.g. users.profile.set)
+
+        token -- The Slack API token
+
+        coalesce_key -- A key identifying writes that replace each other, e.g. (method, user ID) (default None)
+
+        kwargs -- The arguments for the API method
+        """
+        if coalesce_key is not None:
+            generation = next(self.generations)
+            self.latest[coalesce_key] = generation
+
+        def superseded() -> bool:
+            return (
+                coalesce_key is not None and self.latest.get(coalesce_key) != generation
+            )
+
+        send = getattr(self.client, method.replace(".", "_"))
+        try:
+            for attempt in range(self.max_retries + 1):
+                if not await self.bucket(method, token).acquire(superseded):
+                    return None
+                if not await self.bucket(method, None).acquire(superseded):
+                    return None
+                for value in kwargs.values():
+                    if isinstance(value, IOBase):
+                        # Rewind uploads so a retried call sends the whole file again
+                        value.seek(0)
+                try:
+                    return await send(token=token, **kwargs)
+                except SlackApiError as e:
+                    if e.response.status_code != 429 or attempt == self.max_retries:
+                        raise
+                    retry_after = int(e.response.headers.get("Retry-After", 1))
+                    self.bucket(method, None).block(retry_after)
+        finally:
+            if coalesce_key is not None and self.latest.get(coalesce_key) == generation:
+                del self.latest[coalesce_key]
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable
+from collections.abc import Callable
+
+from utils.metrics import TICK_DURATION
+from utils.metrics import TICK_LAG
+from utils.metrics import TICKS_SKIPPED
+
+
+class TickScheduler:
+    """Runs a tick function on a fixed period without letting ticks overlap
+
+    If a tick is still running when the next one is due, the new tick is skipped rather than started alongside it. If the scheduler itself falls behind by more than a period, the missed ticks are merged into the next one instead of firing back to back.
+    """
+
+    def __init__(self, tick: Callable[[], Awaitable]):
+        """Initialises the TickScheduler
+
+        Keyword arguments:
+
+        tick -- The coroutine function to run every tick
+        """
+        self.tick = tick
+        self.task: asyncio.Task | None = None
+        self.ticks = 0
+        self.skipped_ticks = 0
+        self.last_duration = 0.0
+        self.last_lag = 0.0
+
+    async def run(self, period: float):
+        """Runs the tick function every `period` seconds, forever
+
+        Keyword arguments:
+
+        period -- The time in seconds between the start of each tick
+        """
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            self.last_lag = max(0.0, loop.time() - next_tick)
+            TICK_LAG.set(self.last_lag)
+            if self.task and not self.task.done():
+                self.skipped_ticks += 1
+                TICKS_SKIPPED.inc()
+                logging.warning(
+                    f"Skipping tick as the previous one has been running for over {period}s"
+                )
+            else:
+                self.task = asyncio.create_task(self._run_tick(period))
+
+            next_tick += period
+            behind = loop.time() - next_tick
+            if behind > 0:
+                missed = int(behind // period) + 1
+                self.skipped_ticks += missed
+                TICKS_SKIPPED.inc(missed)
+                next_tick += missed * period
+            await asyncio.sleep(next_tick - loop.time())
+
+    async def _run_tick(self, period: float):
+        start = time.monotonic()
+        try:
+            await self.tick()
+        except Exception as e:
+            logging.error(f"Tick failed: {e}")
+        finally:
+            self.ticks += 1
+            self.last_duration = time.monotonic() - start
+            TICK_DURATION.observe(self.last_duration)
+            if self.last_duration > period:
+                logging.warning(
+                    f"Tick took {self.last_duration:.1f}s, longer than its {period}s period"
+                )
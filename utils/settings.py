@@ -0,0 +1,212 @@
+import asyncio
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import OperationFailure
+
+from utils.metrics import CACHE_REQUESTS
+
+# Returned by servers that can't open change streams, e.g. standalone ones
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+class UserSettingsCache:
+    """An in-memory copy of every user's settings document
+
+    It is loaded from the users collection once, kept current by a change stream on that collection and fully reloaded every `resync_interval` seconds in case the change stream is unavailable (e.g. on a standalone server) or missed something. Writes made by this process are applied to it as soon as they are made.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection, resync_interval: int):
+        """Initialises the UserSettingsCache
+
+        Keyword arguments:
+
+        collection -- The users collection
+
+        resync_interval -- The time in seconds between full reloads of the collection
+        """
+        self.collection = collection
+        self.resync_interval = resync_interval
+        self.users: dict[str, dict] = {}
+        self.ids: dict = {}
+        self.loaded = False
+        # Reloads can be started by `run`, `watch` and lazy loads at the same time, so they take turns
+        self.loading = asyncio.Lock()
+        self.watching = False
+        # Changes made while a reload is reading the collection, replayed on top of it
+        self.replay: list[tuple[str, dict | None]] | None = None
+
+    async def load(self):
+        """Reloads every user's settings from the collection, waiting for any reload that is already running"""
+        async with self.loading:
+            self.replay = []
+            try:
+                documents = await self.collection.find({}).to_list()
+            except Exception:
+                self.replay = None
+                raise
+            replay, self.replay = self.replay, None
+
+            self.users = {}
+            self.ids = {}
+            for document in documents:
+                self.set(document)
+            for user_id, data in replay:
+                if data is None:
+                    self.delete(user_id)
+                else:
+                    self.update(user_id, data)
+            self.loaded = True
+
+    def set(self, document: dict):
+        """Stores a user's whole settings document
+
+        Keyword arguments:
+
+        document -- The user's document
+        """
+        user_id = document.get("user_id")
+        if not user_id:
+            return
+        self.users[user_id] = document
+        if "_id" in document:
+            self.ids[document["_id"]] = user_id
+        if self.replay is not None:
+            self.replay.append((user_id, dict(document)))
+
+    def update(self, user_id: str, data: dict):
+        """Applies a settings change to the user's cached document, creating it if the user is new
+
+        Keyword arguments:
+
+        user_id -- The user's ID
+
+        data -- The changed fields
+        """
+        self.users.setdefault(user_id, {"user_id": user_id}).update(data)
+        if self.replay is not None:
+            self.replay.append((user_id, dict(data)))
+
+    def delete(self, user_id: str):
+        """Removes a user from the cache
+
+        Keyword arguments:
+
+        user_id -- The user's ID
+        """
+        document = self.users.pop(user_id, None)
+        if document and "_id" in document:
+            self.ids.pop(document["_id"], None)
+        if self.replay is not None:
+            self.replay.append((user_id, None))
+
+    def get(self, user_id: str) -> dict | None:
+        """Returns a copy of the user's settings, or None if they aren't cached
+
+        Keyword arguments:
+
+        user_id -- The user's ID
+        """
+        document = self.users.get(user_id)
+        CACHE_REQUESTS.labels(
+            cache="settings", result="hit" if document else "miss"
+        ).inc()
+        return dict(document) if document else None
+
+    def all(self, enabled: bool = False, projection: list[str] | None = None):
+        """Returns copies of every cached user's settings
+
+        Keyword arguments:
+
+        enabled -- If True, only returns users that have the app enabled (default False)
+
+        projection -- The fields to return for each user, or None for all fields (default None)
+        """
+        users = []
+        for document in self.users.values():
+            if enabled and document.get("enabled") is False:
+                continue
+            if projection is None:
+                users.append(dict(document))
+            else:
+                users.append(
+                    {
+                        field: document[field]
+                        for field in projection
+                        if field in document
+                    }
+                )
+        return users
+
+    def apply_change(self, change: dict):
+        """Applies a change stream event to the cache
+
+        Keyword arguments:
+
+        change -- The change event, opened with `full_document="updateLookup"`
+        """
+        operation = change.get("operationType")
+        document_id = change.get("documentKey", {}).get("_id")
+        if operation in ["insert", "replace", "update"]:
+            document = change.get("fullDocument")
+            if document:
+                user_id = self.ids.get(document_id)
+                if user_id and user_id != document.get("user_id"):
+                    self.delete(user_id)
+                self.set(document)
+            elif operation == "update" and document_id in self.ids:
+                # The document was deleted before it could be looked up, so its delete event follows
+                self.update(
+                    self.ids[document_id],
+                    change.get("updateDescription", {}).get("updatedFields", {}),
+                )
+        elif operation == "delete":
+            user_id = self.ids.get(document_id)
+            if user_id:
+                self.delete(user_id)
+        elif operation in ["drop", "rename", "dropDatabase", "invalidate"]:
+            self.users = {}
+            self.ids = {}
+
+    async def watch(self):
+        """Applies the collection's change stream to the cache until it's cancelled. Whenever the stream has to be reopened the collection is reloaded first, so no changes are missed in between. Returns if the server doesn't support change streams"""
+        reload = False
+        while True:
+            try:
+                async with self.collection.watch(
+                    full_document="updateLookup"
+                ) as stream:
+                    if reload:
+                        await self.load()
+                    self.watching = True
+                    logging.info("Watching user settings for changes")
+                    async for change in stream:
+                        self.apply_change(change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    self.watching = False
+                    logging.warning(
+                        f"Change streams are unavailable, user settings are reloaded every {self.resync_interval}s instead: {e}"
+                    )
+                    return
+                logging.error(f"User settings change stream failed: {e}")
+            except Exception as e:
+                logging.error(f"User settings change stream failed: {e}")
+            self.watching = False
+            reload = True
+            await asyncio.sleep(5)
+
+    async def run(self):
+        """Watches the collection for changes and reloads it every `resync_interval` seconds"""
+        watch = asyncio.create_task(self.watch())
+        try:
+            while True:
+                await asyncio.sleep(self.resync_interval)
+                try:
+                    await self.load()
+                except Exception as e:
+                    logging.error(f"Failed to reload user settings: {e}")
+        finally:
+            watch.cancel()
@@ -1,20 +1,31 @@
+import asyncio
 import logging
 import re
 import traceback
 from io import BytesIO
 
-import requests
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.oauth.async_oauth_settings import AsyncOAuthSettings
 from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.async_handler import AsyncRetryHandler
+from slack_sdk.http_retry.async_handler import HttpRequest
+from slack_sdk.http_retry.async_handler import HttpResponse
+from slack_sdk.http_retry.async_handler import RetryState
 
 from status.jellyfin import get_jellyfin_status
+from status.jellyfin import prefetch_jellyfin_sessions
 from status.lastfm import get_lastfm_status
 from status.steam import get_steam_status
+from status.steam import prefetch_steam_players
+from utils.cache import TTLCache
 from utils.db import get_user_settings
 from utils.db import update_user_settings
 from utils.env import env
+from utils.images import image_cache
+from utils.metrics import SlackMetricsHandler
+from utils.ratelimit import SlackWriteQueue
 
+# In priority order: when several statuses report activity at once, only the first of them is shown
 STATUSES = [
     {
         "name": "Steam",
@@ -23,6 +34,8 @@ STATUSES = [
         "status": "Playing (custom) via Steam",
         "pfp": "gaming_pfp",
         "function": get_steam_status,
+        "credentials": ["steam_api_key", "steam_id"],
+        "prefetch": prefetch_steam_players,
     },
     {
         "name": "Jellyfin",
@@ -31,6 +44,8 @@ STATUSES = [
         "status": "Watching (custom)",
         "pfp": "film_pfp",
         "function": get_jellyfin_status,
+        "credentials": ["jellyfin_url", "jellyfin_api_key", "jellyfin_username"],
+        "prefetch": prefetch_jellyfin_sessions,
     },
     {
         "name": "Last.fm",
@@ -39,9 +54,12 @@ STATUSES = [
         "status": "(custom)",
         "pfp": "music_pfp",
         "function": get_lastfm_status,
+        "credentials": ["lastfm_api_key", "lastfm_username"],
     },
 ]
 
+TOKEN_ERRORS = ["invalid_auth", "token_revoked", "account_inactive"]
+
 oauth_settings = AsyncOAuthSettings(
     client_id=env.slack_client_id,
     client_secret=env.slack_client_secret,
@@ -63,11 +81,44 @@ oauth_settings = AsyncOAuthSettings(
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Our own writes keep this up to date and user_change/user_status_changed events invalidate it. Those events only reach one process, so it is disabled (STATUS_CACHE_TTL=0) when several can run
+status_cache = TTLCache(ttl=env.status_cache_ttl, name="status")
+
+
+class TokenErrorHandler(AsyncRetryHandler):
+    """Forgets the cached validity of a token as soon as any API call made with it fails because it is invalid. Never retries the call."""
+
+    async def _can_retry_async(
+        self,
+        *,
+        state: RetryState,
+        request: HttpRequest,
+        response: HttpResponse | None = None,
+        error: Exception | None = None,
+    ) -> bool:
+        if response is not None and isinstance(response.body, dict):
+            if response.body.get("error") in TOKEN_ERRORS:
+                authorization = (request.headers.get("Authorization") or [""])[0]
+                env.token_cache.pop(authorization.removeprefix("Bearer "))
+        return False
+
+
+# Seeded from users.list at startup and kept fresh by user_change events
+user_directory = TTLCache(
+    ttl=env.user_directory_ttl,
+    max_size=env.user_directory_max_size,
+    name="user_directory",
+)
+
 app = AsyncApp(
     signing_secret=env.slack_signing_secret,
     oauth_settings=oauth_settings,
     logger=logger,
 )
+app.client.retry_handlers.insert(0, TokenErrorHandler())
+app.client.retry_handlers.insert(0, SlackMetricsHandler())
+
+write_queue = SlackWriteQueue(app.client)
 
 
 ## NOT IMPLEMENTED YET
@@ -87,13 +138,105 @@ app = AsyncApp(
 # await log_to_slack(f"Fetching current status for {user.get('user_id')}\nCurrently listening to {user.get('current_song')}\nCurrently playing {user.get('current_game')}\nCurrently watching: {user.get('current_jellyfin')}", token, channel_id)
 
 
+def cache_slack_user(user: dict) -> dict:
+    """Stores the parts of a Slack user object needed for logging in the user directory and returns them
+
+    Keyword arguments:
+
+    user -- The user object from the Slack API
+    """
+    profile = user.get("profile", {})
+    entry = {
+        "display_name": profile.get("display_name")
+        or profile.get("real_name")
+        or user.get("real_name")
+        or user.get("name"),
+        "image_512": profile.get("image_512"),
+    }
+    user_directory.set(user.get("id"), entry)
+    return entry
+
+
+async def get_slack_user(user_id: str) -> dict:
+    """Returns the user's display name and profile picture URL from the user directory, only calling users.info if they aren't cached
+
+    Keyword arguments:
+
+    user_id -- The user's Slack ID
+    """
+    entry = user_directory.get(user_id)
+    if entry is not None:
+        return entry
+    res = await env.slack_client.users_info(user=user_id)
+    return cache_slack_user(res["user"])
+
+
+async def seed_user_directory(page_size: int = 200):
+    """Fills the user directory from users.list, one page at a time, until every user is cached or it is full
+
+    Keyword arguments:
+
+    page_size -- The number of users to request per page (default 200)
+    """
+    cursor = None
+    while len(user_directory) < env.user_directory_max_size:
+        try:
+            res = await env.slack_client.users_list(limit=page_size, cursor=cursor)
+        except SlackApiError as e:
+            if e.response.status_code == 429:
+                await asyncio.sleep(int(e.response.headers.get("Retry-After", 30)))
+                continue
+            logging.error(f"Failed to seed the user directory: {e}")
+            return
+        for user in res.get("members", []):
+            if not user.get("deleted"):
+                cache_slack_user(user)
+        cursor = res.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            break
+    logging.info(f"Seeded the user directory with {len(user_directory)} users")
+
+
 async def check_token(token: str) -> bool:
-    """Checks if the given token is valid."""
+    """Checks if the given token is valid. The result is cached for `env.token_cache_ttl` seconds. Errors that don't mean the token is invalid (e.g. rate limits) aren't cached and the token is treated as valid"""
+    valid = env.token_cache.get(token)
+    if valid is not None:
+        return valid
     try:
         await app.client.auth_test(token=token)
-        return True
-    except SlackApiError:
-        return False
+        valid = True
+    except SlackApiError as e:
+        if e.response.get("error") not in TOKEN_ERRORS:
+            logging.warning(f"Couldn't check token: {e.response.get('error')}")
+            return True
+        valid = False
+    env.token_cache.set(token, valid)
+    return valid
+
+
+async def get_current_status(user_id: str, token: str) -> dict:
+    """Returns the user's current Slack status text and emoji, only calling users.profile.get if it isn't cached
+
+    Keyword arguments:
+
+    user_id -- The user's Slack ID.
+
+    token -- The Slack API token.
+    """
+    current_status = status_cache.get(user_id) if env.status_cache_ttl > 0 else None
+    if current_status is not None:
+        return current_status
+
+    res = await app.client.users_profile_get(user=user_id, token=token)
+    if not res.get("ok"):
+        return {}
+    current_status = {
+        "status_text": res["profile"].get("status_text", ""),
+        "status_emoji": res["profile"].get("status_emoji", ""),
+    }
+    if env.status_cache_ttl > 0:
+        status_cache.set(user_id, current_status)
+    return current_status
 
 
 async def update_slack_status(emoji, status, user_id, token, expiry=0):
@@ -111,11 +254,8 @@ async def update_slack_status(emoji, status, user_id, token, expiry=0):
 
     expiry -- The time in seconds until the status expires (default 0).
     """
-    current_status = await app.client.users_profile_get(user=user_id, token=token)
-    if current_status.get("ok"):
-        status_emoji = current_status["profile"].get("status_emoji", "")
-    else:
-        status_emoji = ""
+    current_status = await get_current_status(user_id, token)
+    status_emoji = current_status.get("status_emoji", "")
 
     user = await get_user_settings(user_id)
     if not user:
@@ -137,7 +277,7 @@ async def update_slack_status(emoji, status, user_id, token, expiry=0):
     emojis.append(user.get("huddle_emoji", ":headphones:"))
     HACKATIME_REGEX = r"spent on \w+ today$"
 
-    current_status_text = current_status["profile"].get("status_text", "")
+    current_status_text = current_status.get("status_text", "")
     if (
         status_emoji in emojis
         or status_emoji == ""
@@ -145,25 +285,29 @@ async def update_slack_status(emoji, status, user_id, token, expiry=0):
     ):
         if current_status_text == status:
             return
-        await app.client.users_profile_set(
-            user=user_id,
-            profile={
-                "status_text": status,
-                "status_emoji": user.get(
-                    emoji,
-                    next(
-                        (
-                            status.get("default_emoji")
-                            for status in STATUSES
-                            if status.get("emoji") == emoji
-                        ),
-                        "",
+        new_status = {
+            "status_text": status,
+            "status_emoji": user.get(
+                emoji,
+                next(
+                    (
+                        status.get("default_emoji")
+                        for status in STATUSES
+                        if status.get("emoji") == emoji
                     ),
+                    "",
                 ),
-                "status_expiration": expiry,
-            },
-            token=token,
+            ),
+        }
+        res = await write_queue.call(
+            "users.profile.set",
+            token,
+            coalesce_key=("users.profile.set", user_id),
+            user=user_id,
+            profile={**new_status, "status_expiration": expiry},
         )
+        if res is not None:
+            status_cache.set(user_id, new_status)
 
 
 async def update_slack_pfp(
@@ -188,8 +332,8 @@ async def update_slack_pfp(
     if new_pfp_type != current_pfp and img_url:
         await update_user_settings(user_id, {"pfp": new_pfp_type})
         try:
-            res = requests.get(img_url)
-            if res.status_code != 200 or "image" not in res.headers["Content-Type"]:
+            image = await image_cache.fetch(env.http_session, img_url)
+            if not image:
                 # Notify user that the image is invalid
                 await app.client.chat_postMessage(
                     channel=user_id,
@@ -198,8 +342,17 @@ async def update_slack_pfp(
                 )
                 return
 
-            content = BytesIO(res.content)
-            await app.client.users_setPhoto(image=content, token=token)
+            content, digest = image
+            if image_cache.is_uploaded(user_id, digest):
+                return
+            res = await write_queue.call(
+                "users.setPhoto",
+                token,
+                coalesce_key=("users.setPhoto", user_id),
+                image=BytesIO(content),
+            )
+            if res is not None:
+                image_cache.mark_uploaded(user_id, digest)
         except Exception as e:
             # Log the exception or notify the user
             exception_details = f"Exception type: {type(e).__name__}, Arguments: {e.args}, Traceback: {traceback.format_exc()}"
@@ -232,10 +385,11 @@ async def log_to_slack(
 
     username -- The username of the user posting the message.
     """
-    await app.client.chat_postMessage(
+    await write_queue.call(
+        "chat.postMessage",
+        token,
         channel=channel_id,
         text=message,
-        token=token,
         username=username,
         icon_url=pfp,
         unfurl_links=False,
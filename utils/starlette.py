@@ -1,6 +1,9 @@
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import generate_latest
 from slack_bolt.adapter.starlette.async_handler import AsyncSlackRequestHandler
 from starlette.applications import Starlette
 from starlette.requests import Request
+from starlette.responses import Response
 from starlette.routing import Route
 
 from app import main
@@ -22,12 +25,17 @@ async def oauth_redirect(req: Request):
     return await req_handler.handle(req)
 
 
+async def metrics(req: Request):
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 app = Starlette(
     debug=True if env.environment != "production" else False,
     routes=[
         Route(path="/slack/events", endpoint=endpoint, methods=["POST"]),
         Route(path="/slack/install", endpoint=install, methods=["GET"]),
         Route(path="/slack/oauth_redirect", endpoint=oauth_redirect, methods=["GET"]),
+        Route(path="/metrics", endpoint=metrics, methods=["GET"]),
     ],
     lifespan=main,
 )
@@ -1,101 +1,225 @@
 import asyncio
 import logging
 
+from slack_sdk.oauth.installation_store.models.installation import Installation
+
+from utils.activity import activity_log
+from utils.db import buffered_user_writes
 from utils.db import get_all_users
+from utils.db import UPDATER_FIELDS
 from utils.env import env
+from utils.leases import partition_leases
+from utils.metrics import USERS_PROCESSED
+from utils.metrics import USERS_SKIPPED
+from utils.polling import polling_policy
+from utils.scheduler import TickScheduler
 from utils.slack import app
 from utils.slack import check_token
-from utils.slack import log_to_slack
 from utils.slack import STATUSES
 from utils.slack import update_slack_pfp
 from utils.slack import update_slack_status
 
+# Users whose evaluation is still running, so they are never evaluated twice at once
+users_in_flight: set[str] = set()
+
 
 async def run_updater(delay: int = 35):
-    """Runs the updater every `delay` seconds"""
-    while True:
-        asyncio.create_task(update_status())
-        await asyncio.sleep(delay)
+    """Runs the updater every `delay` seconds, skipping ticks while the previous one is still running"""
+    await scheduler.run(delay)
 
 
 async def update_status(delay: int = 10):
-    """Fetches the status of all users from all services and then updates Slack status and profile pictures accordingly"""
-    users = await get_all_users(enabled=True)
+    """Fetches the status of all users from all services and then updates Slack status and profile pictures accordingly
+
+    Users are processed concurrently, with at most `env.updater_concurrency` users being evaluated at once.
+    """
+    users = await get_all_users(enabled=True, projection=UPDATER_FIELDS)
+    if env.updater_sharding:
+        owned = [user for user in users if partition_leases.owns(user.get("user_id"))]
+        USERS_SKIPPED.labels(reason="other_shard").inc(len(users) - len(owned))
+        users = owned
+    due = [user for user in users if should_poll(user)]
+    USERS_SKIPPED.labels(reason="not_due").inc(len(users) - len(due))
+    users = due
     if not users:
         return
 
-    for user in users:
-        set = False
-        if user.get("in_huddle", False):
-            continue
+    installations = await env.installation_store.async_preload_installations(
+        [user.get("user_id") for user in users]
+    )
+    prefetched = await prefetch_statuses(users)
+    semaphore = asyncio.Semaphore(max(1, env.updater_concurrency))
 
-        installation = await env.installation_store.async_find_installation(
-            user_id=user.get("user_id")
-        )
+    async def worker(user: dict):
+        user_id = user.get("user_id")
+        installation = installations.get(user_id)
         if not installation:
+            USERS_SKIPPED.labels(reason="no_installation").inc()
+            return
+        if user_id in users_in_flight:
+            USERS_SKIPPED.labels(reason="in_flight").inc()
+            return
+        users_in_flight.add(user_id)
+        try:
+            async with semaphore:
+                try:
+                    active = await update_user(user, installation, prefetched)
+                except Exception as e:
+                    logging.error(f"Failed to update status for {user_id}: {e}")
+                    active = False
+            polling_policy.record(user_id, active)
+            USERS_PROCESSED.inc()
+        finally:
+            users_in_flight.discard(user_id)
+
+    async with buffered_user_writes(users):
+        await asyncio.gather(*(worker(user) for user in users))
+
+
+def should_poll(user: dict) -> bool:
+    """Returns True if the user is due to be polled by the polling policy. Users without credentials for any status are skipped entirely, unless a status they had set still needs clearing
+
+    Keyword arguments:
+
+    user -- A dictionary with the user's settings
+    """
+    has_credentials = any(
+        all(user.get(field) for field in status.get("credentials", []))
+        for status in STATUSES
+    )
+    has_current = any(
+        user.get(field)
+        for field in ["current_song", "current_game", "current_jellyfin"]
+    )
+    if not has_credentials and not has_current:
+        return False
+    return polling_policy.is_due(user.get("user_id"))
+
+
+async def prefetch_statuses(users: list[dict]) -> dict:
+    """Runs the batch `prefetch` function of every status that has one for all users at once. Returns the results keyed by status name, leaving out any that failed so those statuses fall back to fetching per user
+
+    Keyword arguments:
+
+    users -- A list of dictionaries with the users' settings
+    """
+    statuses = [status for status in STATUSES if status.get("prefetch")]
+    results = await asyncio.gather(
+        *(status["prefetch"](users) for status in statuses), return_exceptions=True
+    )
+    prefetched = {}
+    for status, result in zip(statuses, results):
+        if isinstance(result, Exception):
+            logging.error(f"Failed to prefetch {status.get('name')}: {result}")
             continue
+        prefetched[status.get("name")] = result
+    return prefetched
 
-        bot_token = installation.bot_token or ""
-        user_token = installation.user_token or ""
-        user_id = user.get("user_id")
 
-        if not await check_token(user_token):
-            try:
-                await app.client.chat_postMessage(
-                    channel=user.get("user_id"),
-                    text="Your token is invalid. Please reauthenticate with the app via the red button at the bottom of the app home.",
-                    token=installation.bot_token,
-                )
-            finally:
-                logging.error(
-                    f"User {user.get('user_id')} has an invalid token. Skipping."
-                )
-                continue
-
-        current_pfp = user.get("pfp")
-        for status in STATUSES:
-            custom, log_message = await status.get(
-                "function",
-                lambda _: logging.error(
-                    f"Failed to run status fetching function for {status.get('name')}"
-                ),
-            )(user)
-            if custom:
-                await update_slack_status(
-                    status.get("emoji"),
-                    status.get("status", "").replace("(custom)", custom)[:100],
-                    user_id=user_id,
-                    token=user_token,
-                )
-                await update_slack_pfp(
-                    new_pfp_type=status.get("pfp"),
-                    current_pfp=current_pfp,
-                    user_id=user_id,
-                    bot_token=bot_token,
-                    token=user_token,
-                    img_url=user.get(status.get("pfp"), None),
-                )
-                set = True
-            if log_message:
-                slack_user = await app.client.users_info(user=user_id, token=bot_token)
-                pfp = slack_user["user"]["profile"]["image_512"]
-                username = (
-                    slack_user["user"]["profile"]["display_name"]
-                    or slack_user["user"]["real_name"]
-                    or slack_user["user"]["name"]
-                )
-                await log_to_slack(log_message, bot_token, pfp=pfp, username=username)
-                continue
-
-        if not set:
-            await update_slack_status(
-                emoji="", status="", user_id=user_id, token=user_token
-            )
-            await update_slack_pfp(
-                new_pfp_type="default_pfp",
-                current_pfp=current_pfp,
-                user_id=user_id,
-                bot_token=bot_token,
-                token=user_token,
-                img_url=user.get("default_pfp", None),
+async def fetch_status(
+    status: dict, user: dict, prefetched: dict
+) -> tuple[str | None, str | None]:
+    """Runs a status's fetching function for a user and returns its (custom status, log message) tuple. A function that errors is logged and treated as reporting no activity, so it can't stop the user's other statuses from being shown
+
+    Keyword arguments:
+
+    status -- The status from `STATUSES`
+
+    user -- A dictionary with the user's settings
+
+    prefetched -- The results of `prefetch_statuses` for the current tick
+    """
+    function = status.get("function")
+    if not function:
+        logging.error(
+            f"Failed to run status fetching function for {status.get('name')}"
+        )
+        return None, None
+    args = (prefetched[status.get("name")],) if status.get("name") in prefetched else ()
+    try:
+        return await function(user, *args) or (None, None)
+    except Exception as e:
+        logging.error(
+            f"Failed to fetch {status.get('name')} status for {user.get('user_id')}: {e}"
+        )
+        return None, None
+
+
+async def update_user(
+    user: dict, installation: Installation, prefetched: dict | None = None
+) -> bool:
+    """Fetches the status of a single user from all services at once and then updates their Slack status and profile picture to the highest priority status reporting activity. Returns True if any status reported activity
+
+    Keyword arguments:
+
+    user -- A dictionary with the user's settings
+
+    installation -- The user's installation data
+
+    prefetched -- The results of `prefetch_statuses` for the current tick (default None)
+    """
+    prefetched = prefetched or {}
+    set = False
+    if user.get("in_huddle", False):
+        return False
+
+    bot_token = installation.bot_token or ""
+    user_token = installation.user_token or ""
+    user_id = user.get("user_id")
+
+    if not await check_token(user_token):
+        try:
+            await app.client.chat_postMessage(
+                channel=user.get("user_id"),
+                text="Your token is invalid. Please reauthenticate with the app via the red button at the bottom of the app home.",
+                token=installation.bot_token,
             )
+        finally:
+            logging.error(f"User {user.get('user_id')} has an invalid token. Skipping.")
+            return False
+
+    current_pfp = user.get("pfp")
+    results = await asyncio.gather(
+        *(fetch_status(status, user, prefetched) for status in STATUSES)
+    )
+    winner = next(
+        ((status, custom) for status, (custom, _) in zip(STATUSES, results) if custom),
+        None,
+    )
+    if winner:
+        status, custom = winner
+        await update_slack_status(
+            status.get("emoji"),
+            status.get("status", "").replace("(custom)", custom)[:100],
+            user_id=user_id,
+            token=user_token,
+        )
+        await update_slack_pfp(
+            new_pfp_type=status.get("pfp"),
+            current_pfp=current_pfp,
+            user_id=user_id,
+            bot_token=bot_token,
+            token=user_token,
+            img_url=user.get(status.get("pfp"), None),
+        )
+        set = True
+    for _, log_message in results:
+        if log_message:
+            activity_log.log(user_id, log_message, bot_token)
+
+    if not set:
+        await update_slack_status(
+            emoji="", status="", user_id=user_id, token=user_token
+        )
+        await update_slack_pfp(
+            new_pfp_type="default_pfp",
+            current_pfp=current_pfp,
+            user_id=user_id,
+            bot_token=bot_token,
+            token=user_token,
+            img_url=user.get("default_pfp", None),
+        )
+    return set
+
+
+scheduler = TickScheduler(update_status)